@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Offline analysis of recorded games.
+
+Replays every game of a records file (see records.py) through gipf.Board
+and scores each ply with an engine: the score of the move played, the
+best move and its score, and whether the move lost more than the blunder
+threshold.  Games are analyzed in parallel over a multiprocessing pool
+and each result is appended to the output as one JSON line as soon as it
+is ready, so an interrupted run picks up where it stopped:
+
+    analyze.py games.log analysis.jsonl --engine negamax --depth 2
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+import engine
+import profiler
+import records
+
+
+def AnalyzeGame(record, game_engine, blunder_threshold):
+    """Score every ply of record, returning a JSON-friendly dict."""
+    plies = []
+    for ply, board, color, move in records.Positions(record.moves):
+        scores = game_engine.ScoreMoves(board, color)
+        if move not in scores:
+            plies.append({'ply': ply, 'color': color, 'move': move,
+                          'illegal': True})
+            break
+        best = max(sorted(scores), key=lambda m: scores[m])
+        loss = scores[best] - scores[move]
+        plies.append({'ply': ply,
+                      'color': color,
+                      'move': move,
+                      'score': scores[move],
+                      'best': best,
+                      'best_score': scores[best],
+                      'loss': loss,
+                      'blunder': loss >= blunder_threshold,
+                      'nodes': game_engine.nodes})
+    return {'game_id': record.game_id,
+            'winner': record.winner,
+            'plies': plies}
+
+
+# Per-worker state set up by _InitWorker.
+_worker = {}
+
+
+def _InitWorker(engine_name, depth, max_nodes, blunder_threshold, profile):
+    _worker['engine'] = engine.MakeEngine(engine_name, depth, max_nodes)
+    _worker['blunder_threshold'] = blunder_threshold
+    _worker['profile'] = profile
+    if profile:
+        profiler.InitWorker()
+
+
+def _AnalyzeTask(record):
+    result = AnalyzeGame(record,
+                         _worker['engine'],
+                         _worker['blunder_threshold'])
+    stats = profiler.Collect() if _worker['profile'] else None
+    return result, stats
+
+
+def _PendingGames(path, done):
+    for record in records.ReadGames(path):
+        if record.game_id not in done:
+            yield record
+
+
+def Run(games_path, output_path, engine_name='negamax', depth=2,
+        max_nodes=None, blunder_threshold=engine.PIECE, processes=None,
+        chunksize=4, profile=False):
+    """Analyze every game of games_path not yet in output_path.
+
+    Returns the merged profiler stats when profile is set, else None.
+    """
+    records.TrimPartialLine(output_path)
+    done = records.CompletedKeys(output_path, 'game_id')
+    if done:
+        print 'Resuming, %d games already analyzed' % len(done)
+
+    pool = multiprocessing.Pool(processes, _InitWorker,
+                                (engine_name, depth, max_nodes,
+                                 blunder_threshold, profile))
+    all_stats = []
+    count = 0
+    start = time.time()
+    try:
+        with open(output_path, 'a') as out:
+            for result, stats in pool.imap_unordered(
+                    _AnalyzeTask, _PendingGames(games_path, done),
+                    chunksize):
+                out.write(json.dumps(result, sort_keys=True) + '\n')
+                out.flush()
+                if stats:
+                    all_stats.append(stats)
+                count += 1
+                if count % 100 == 0:
+                    print '%d games in %.1fs' % (count, time.time() - start)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    print 'Analyzed %d games in %.1fs' % (count, time.time() - start)
+    if profile:
+        return profiler.Merge(*all_stats)
+    return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('games', help='game records to analyze')
+    parser.add_argument('output', help='JSON lines file of results')
+    parser.add_argument('--engine', default='negamax',
+                        choices=sorted(engine.ENGINES))
+    parser.add_argument('--depth', type=int, default=2,
+                        help='search depth in plies')
+    parser.add_argument('--max-nodes', type=int, default=None,
+                        help='node budget per position')
+    parser.add_argument('--blunder', type=int, default=engine.PIECE,
+                        help='score loss that flags a blunder')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=4,
+                        help='games handed to a worker at a time')
+    parser.add_argument('--profile', action='store_true',
+                        help='print merged gipf.Board stats of all workers')
+    args = parser.parse_args(argv)
+
+    stats = Run(args.games, args.output, args.engine, args.depth,
+                args.max_nodes, args.blunder, args.processes,
+                args.chunksize, args.profile)
+    if stats:
+        print profiler.Format(stats)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,149 @@
+"""
+Game clocks driven by one shared scheduler thread.
+
+A ClockScheduler keeps the deadlines of every running clock in a heap and
+sleeps until the earliest one, so thousands of games cost one thread and
+one heap entry per running clock rather than a timer thread each.
+Cancelled deadlines are dropped lazily when they reach the top of the
+heap, and the heap is rebuilt if they come to outnumber the live ones.
+"""
+
+import functools
+import heapq
+import itertools
+import threading
+import time
+
+import gipf
+
+
+class ClockScheduler(threading.Thread):
+    """Calls callbacks at their deadlines from a single thread."""
+
+    def __init__(self):
+        super(ClockScheduler, self).__init__()
+        self.daemon = True
+        self._heap = []
+        self._cancelled = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def Schedule(self, deadline, callback):
+        """Call callback() at time deadline, return a handle for Cancel."""
+        entry = [deadline, next(self._sequence), callback]
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._condition.notify()
+        return entry
+
+    def Cancel(self, entry):
+        """Cancel a scheduled callback, if it has not been called yet."""
+        with self._condition:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap) - self._cancelled
+
+    def _NextDue(self):
+        """Wait for and pop the next live callback that is due."""
+        with self._condition:
+            while True:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                entry = heapq.heappop(self._heap)
+                callback = entry[2]
+                entry[2] = None
+                return callback
+
+    def run(self):
+        while True:
+            callback = self._NextDue()
+            try:
+                callback()
+            except Exception, e:
+                print 'ERROR - clock callback failed:', e
+
+
+class GameClock(object):
+    """Chess-style clock for the two players of one game.
+
+    Each player starts with base seconds and gains increment seconds for
+    every move they complete.  When the running player's time is up,
+    on_flag(color) is called from the scheduler thread.  The callback
+    should check Remaining(color) under the game's lock, since a move may
+    have pressed the clock just as it fired.
+    """
+
+    __slots__ = ('_scheduler', '_increment', '_on_flag', '_remaining',
+                 'running', '_started', '_entry')
+
+    def __init__(self, scheduler, base, increment, on_flag):
+        self._scheduler = scheduler
+        self._increment = increment
+        self._on_flag = on_flag
+        # Indexed by color.
+        self._remaining = [None, float(base), float(base)]
+        self.running = None
+        self._started = None
+        self._entry = None
+
+    def Start(self, color):
+        """Start color's clock running."""
+        self.Stop()
+        self.running = color
+        self._started = time.time()
+        self._entry = self._scheduler.Schedule(
+            self._started + self._remaining[color],
+            functools.partial(self._on_flag, color))
+
+    def Stop(self):
+        """Stop the running clock, charging it for the time used."""
+        if self.running is None:
+            return
+        self._scheduler.Cancel(self._entry)
+        self._remaining[self.running] -= time.time() - self._started
+        self.running = None
+        self._entry = None
+
+    def Press(self, color):
+        """color completed a move: add the increment, start the opponent."""
+        self.Stop()
+        self._remaining[color] += self._increment
+        if color == gipf.Board.WHITE:
+            self.Start(gipf.Board.BLACK)
+        else:
+            self.Start(gipf.Board.WHITE)
+
+    def SetRemaining(self, color, seconds):
+        """Set the time left on color's clock, which must be stopped."""
+        self._remaining[color] = float(seconds)
+
+    def Remaining(self, color):
+        """Seconds left on color's clock."""
+        remaining = self._remaining[color]
+        if color == self.running:
+            remaining -= time.time() - self._started
+        return remaining
+
+
+def ParseTimeControl(text):
+    """Parse 'BASE+INCREMENT' in seconds, e.g. '300+5', into a tuple."""
+    base, _, increment = text.partition('+')
+    return float(base), float(increment or 0)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+"""
+Columnar game-record datasets for bulk queries.
+
+A dataset is a directory of flat binary columns that NumPy maps straight
+from disk:
+
+    letters.u8, numbers.u8, directions.u8
+                     one uint8 per move, games stored back to back
+    offsets.i8       int64 index of each game's first move, plus the total
+    winners.u8       uint8 winning color of each game (0 if unfinished)
+    game_ids.txt     one game id per line
+    meta.json        version and counts, written last
+
+Game k's moves are letters[offsets[k]:offsets[k + 1]] and so on.  Queries
+walk the move columns in chunks of whole games, so memory stays bounded
+by the chunk size however large the dataset is.  Converting from the
+records.py text format is a single streaming pass:
+
+    dataset.py convert games.log games.d
+    dataset.py summary games.d --winner 1 --max-ply 20
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import gipf
+import records
+
+VERSION = 1
+MOVE_COLUMNS = ('letters', 'numbers', 'directions')
+
+# Moves are buffered up to this many before being appended to the columns.
+_CONVERT_CHUNK = 1 << 20
+# Moves per chunk when scanning the columns.
+_SCAN_CHUNK = 1 << 22
+
+
+class _ColumnWriter(object):
+    """Appends games to the column files of a new dataset."""
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            # A dataset is only valid once meta.json exists, so drop it
+            # first and a failed conversion cannot pass for a finished one.
+            os.remove(meta_path)
+        self._path = path
+        self._files = dict((name, open(os.path.join(path, name), 'wb'))
+                           for name in ('letters.u8', 'numbers.u8',
+                                        'directions.u8', 'offsets.i8',
+                                        'winners.u8', 'game_ids.txt'))
+        self._moves = []
+        self._buffered = 0
+        self._offsets = [0]
+        self._winners = bytearray()
+        self.num_games = 0
+        self.num_moves = 0
+
+    def Add(self, game_id, winner, digits):
+        """Add a game whose moves are given as a string of digits."""
+        if '\n' in game_id:
+            raise ValueError('bad game id %r' % game_id)
+        self._files['game_ids.txt'].write(game_id + '\n')
+        self._moves.append(digits)
+        self._buffered += len(digits) // 3
+        self.num_moves += len(digits) // 3
+        self.num_games += 1
+        self._offsets.append(self.num_moves)
+        self._winners.append(winner)
+        if self._buffered >= _CONVERT_CHUNK:
+            self._Flush()
+
+    def _Flush(self):
+        moves = numpy.frombuffer(''.join(self._moves), dtype=numpy.uint8)
+        moves = (moves - ord('0')).reshape(-1, 3)
+        for k, name in enumerate(MOVE_COLUMNS):
+            numpy.ascontiguousarray(moves[:, k]).tofile(
+                self._files[name + '.u8'])
+        numpy.array(self._offsets, dtype=numpy.int64).tofile(
+            self._files['offsets.i8'])
+        self._files['winners.u8'].write(self._winners)
+        self._moves = []
+        self._buffered = 0
+        self._offsets = []
+        self._winners = bytearray()
+
+    def Close(self):
+        """Write out the last chunk and meta.json."""
+        self._Flush()
+        for f in self._files.values():
+            f.close()
+        meta = {'version': VERSION,
+                'num_games': self.num_games,
+                'num_moves': self.num_moves}
+        with open(os.path.join(self._path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, sort_keys=True)
+            f.write('\n')
+
+
+def _MoveDigits(fields):
+    """The moves of a split record line as one string of digits."""
+    moves = fields[2:]
+    digits = ''.join(moves)
+    if len(digits) != 3 * len(moves) or (digits and not digits.isdigit()):
+        # Let records report the offending move.
+        records.ParseGame(' '.join(fields))
+        raise ValueError('bad moves in game %s' % fields[0])
+    return digits
+
+
+def Convert(games_path, path):
+    """Convert a records.py games file into a dataset at path.
+
+    The games file is read one line at a time and moves are appended to
+    the columns in chunks, so memory does not grow with the input.
+    Returns the number of games converted.
+    """
+    writer = _ColumnWriter(path)
+    with open(games_path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) < 2:
+                raise ValueError('bad game record: %r' % line)
+            writer.Add(fields[0], int(fields[1]), _MoveDigits(fields))
+    writer.Close()
+    return writer.num_games
+
+
+def _Load(path, name, dtype, count):
+    """Memory-map a column file, which NumPy cannot do when it is empty."""
+    if count == 0:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(os.path.join(path, name), dtype=dtype, mode='r',
+                        shape=(count,))
+
+
+class Dataset(object):
+    """A dataset directory, memory-mapped read-only.
+
+    Filters are boolean masks over games, built from winners, Lengths()
+    or Where(), and every aggregate takes one as its games argument.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != VERSION:
+            raise ValueError('%s is not a version %d dataset' %
+                             (path, VERSION))
+        self.path = path
+        self.num_games = meta['num_games']
+        self.num_moves = meta['num_moves']
+        self.letters = _Load(path, 'letters.u8', numpy.uint8, self.num_moves)
+        self.numbers = _Load(path, 'numbers.u8', numpy.uint8, self.num_moves)
+        self.directions = _Load(path, 'directions.u8', numpy.uint8,
+                                self.num_moves)
+        self.offsets = _Load(path, 'offsets.i8', numpy.int64,
+                             self.num_games + 1)
+        self.winners = _Load(path, 'winners.u8', numpy.uint8, self.num_games)
+        self._game_ids = None
+
+    def __len__(self):
+        return self.num_games
+
+    def GameIds(self):
+        """The list of game ids, read on first use."""
+        if self._game_ids is None:
+            with open(os.path.join(self.path, 'game_ids.txt')) as f:
+                self._game_ids = [line.rstrip('\n') for line in f]
+        return self._game_ids
+
+    def Moves(self, game):
+        """Game's moves as a list of (letter, number, direction)."""
+        start, end = self.offsets[game], self.offsets[game + 1]
+        return zip(self.letters[start:end].tolist(),
+                   self.numbers[start:end].tolist(),
+                   self.directions[start:end].tolist())
+
+    def Record(self, game):
+        """Game as a records.GameRecord."""
+        return records.GameRecord(self.GameIds()[game], self.Moves(game),
+                                  int(self.winners[game]))
+
+    def Lengths(self):
+        """Number of moves of each game."""
+        return numpy.diff(self.offsets)
+
+    def Where(self, winner=None, min_length=None, max_length=None):
+        """Boolean mask of the games matching every given condition."""
+        mask = numpy.ones(self.num_games, dtype=bool)
+        if winner is not None:
+            mask &= self.winners == winner
+        if min_length is not None or max_length is not None:
+            lengths = self.Lengths()
+            if min_length is not None:
+                mask &= lengths >= min_length
+            if max_length is not None:
+                mask &= lengths <= max_length
+        return mask
+
+    def _Chunks(self, chunk_moves=_SCAN_CHUNK):
+        """Split the games into runs of about chunk_moves moves each.
+
+        Yields (first_game, end_game) ranges; a game longer than
+        chunk_moves gets a chunk to itself.
+        """
+        bounds = numpy.searchsorted(
+            self.offsets, numpy.arange(0, self.num_moves, chunk_moves),
+            side='right') - 1
+        bounds = numpy.unique(numpy.append(bounds, self.num_games))
+        for first, end in itertools.izip(bounds[:-1], bounds[1:]):
+            yield int(first), int(end)
+
+    def _Scan(self, games=None, color=None, min_ply=None, max_ply=None):
+        """Yield (start, end, mask) over the move columns.
+
+        mask selects the moves of [start, end) that belong to the games
+        selected by the games mask, are played by color and fall within
+        [min_ply, max_ply); it is None when every move is selected.
+        """
+        lengths = self.Lengths()
+        for first, end in self._Chunks():
+            start, stop = int(self.offsets[first]), int(self.offsets[end])
+            if start == stop:
+                continue
+            mask = None
+            if games is not None:
+                mask = numpy.repeat(games[first:end], lengths[first:end])
+            if color is not None or min_ply is not None or \
+                    max_ply is not None:
+                # Ply of each move within its game.
+                plies = numpy.arange(start, stop) - numpy.repeat(
+                    self.offsets[first:end], lengths[first:end])
+                selected = numpy.ones(stop - start, dtype=bool)
+                if color is not None:
+                    first_ply = 0 if color == gipf.Board.WHITE else 1
+                    selected &= plies % 2 == first_ply
+                if min_ply is not None:
+                    selected &= plies >= min_ply
+                if max_ply is not None:
+                    selected &= plies < max_ply
+                mask = selected if mask is None else mask & selected
+            yield start, stop, mask
+
+    def MoveCounts(self, games=None, color=None, min_ply=None, max_ply=None):
+        """How often each move was played, as a (10, 10, 10) int64 array.
+
+        counts[letter, number, direction] counts the selected moves, see
+        _Scan for the filters.
+        """
+        counts = numpy.zeros(1000, dtype=numpy.int64)
+        for start, stop, mask in self._Scan(games, color, min_ply, max_ply):
+            codes = self.letters[start:stop].astype(numpy.int16) * 100
+            codes += self.numbers[start:stop] * numpy.int16(10)
+            codes += self.directions[start:stop]
+            if mask is not None:
+                codes = codes[mask]
+            counts += numpy.bincount(codes, minlength=1000)
+        return counts.reshape(10, 10, 10)
+
+    def EntryCounts(self, **filters):
+        """How often each entry dot was played, as a {(letter, number):
+        count} dict over the entry spots, taking MoveCounts' filters."""
+        counts = self.MoveCounts(**filters).sum(axis=2)
+        return dict((spot, int(counts[spot]))
+                    for spot in gipf.Board().EntrySpots())
+
+    def WinRates(self, games=None):
+        """Fraction of the selected games won by each color.
+
+        Returns {Board.WHITE: rate, Board.BLACK: rate, 0: rate}, 0 being
+        the games that did not finish.
+        """
+        winners = self.winners if games is None else self.winners[games]
+        counts = numpy.bincount(winners, minlength=3).astype(float)
+        total = max(counts.sum(), 1)
+        return {gipf.Board.WHITE: counts[gipf.Board.WHITE] / total,
+                gipf.Board.BLACK: counts[gipf.Board.BLACK] / total,
+                0: counts[0] / total}
+
+
+def Summary(data, games=None, color=None, min_ply=None, max_ply=None):
+    """A text report of game lengths, win rates and entry dot usage."""
+    lengths = data.Lengths()
+    if games is not None:
+        lengths = lengths[games]
+    lines = ['%d games, %d moves' % (len(lengths), lengths.sum())]
+    if len(lengths):
+        lines.append('length: mean %.1f, min %d, median %d, max %d' % (
+            lengths.mean(), lengths.min(), numpy.median(lengths),
+            lengths.max()))
+    rates = data.WinRates(games)
+    lines.append('white wins %.1f%%, black wins %.1f%%, unfinished %.1f%%' %
+                 (100 * rates[gipf.Board.WHITE], 100 * rates[gipf.Board.BLACK],
+                  100 * rates[0]))
+    entries = data.EntryCounts(games=games, color=color, min_ply=min_ply,
+                               max_ply=max_ply)
+    total = max(sum(entries.values()), 1)
+    lines.append('entry dot  moves')
+    for spot, count in sorted(entries.items(),
+                                 key=lambda item: (-item[1], item[0])):
+        lines.append('%d%d %12d  %5.1f%%' % (spot[0], spot[1], count,
+                                              100.0 * count / total))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    subparsers = parser.add_subparsers(dest='command')
+    convert = subparsers.add_parser('convert',
+                                    help='convert a games file to a dataset')
+    convert.add_argument('games', help='games file, one record per line')
+    convert.add_argument('dataset', help='dataset directory to write')
+    summary = subparsers.add_parser('summary', help='summarize a dataset')
+    summary.add_argument('dataset', help='dataset directory')
+    summary.add_argument('--winner', type=int, choices=(0, 1, 2),
+                         help='only games won by this color')
+    summary.add_argument('--min-length', type=int)
+    summary.add_argument('--max-length', type=int)
+    summary.add_argument('--color', type=int, choices=(1, 2),
+                         help='only count entry dots played by this color')
+    summary.add_argument('--min-ply', type=int)
+    summary.add_argument('--max-ply', type=int)
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    if args.command == 'convert':
+        count = Convert(args.games, args.dataset)
+        print 'Converted %d games in %.1fs' % (count, time.time() - start)
+        return 0
+
+    data = Dataset(args.dataset)
+    games = None
+    if (args.winner is not None or args.min_length is not None or
+            args.max_length is not None):
+        games = data.Where(args.winner, args.min_length, args.max_length)
+    print Summary(data, games, args.color, args.min_ply, args.max_ply)
+    print 'Scanned in %.2fs' % (time.time() - start)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
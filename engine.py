@@ -0,0 +1,160 @@
+"""
+Position evaluation and search for GIPF.
+
+Scores are from the point of view of the player to move and measured in
+pieces: one reserve piece is worth PIECE, and a win is WIN.  An engine
+scores every legal move of a position by negamax search with alpha-beta
+pruning, deepening one ply at a time until it reaches its depth or runs
+out of its node budget.
+"""
+
+import gipf
+
+PIECE = 100
+THREAT = 10
+WIN = 100000
+
+
+def _BuildWindows():
+    """Every run of 4 consecutive cells along a row."""
+    windows = []
+    for row in gipf.CAPTURE_ROWS:
+        cells = gipf.ROW_CELLS[row]
+        for k in range(len(cells) - 3):
+            windows.append(cells[k:k + 4])
+    return tuple(windows)
+
+WINDOWS = _BuildWindows()
+
+
+def Threats(board, color):
+    """Number of 4-cell windows with 3 of color's pieces and a gap."""
+    pieces = board.pieces
+    threats = 0
+    for window in WINDOWS:
+        own = 0
+        empty = 0
+        for i, j in window:
+            piece = pieces[i][j]
+            if piece == color:
+                own += 1
+            elif piece == 0:
+                empty += 1
+        if own == 3 and empty == 1:
+            threats += 1
+    return threats
+
+
+def Reserve(board, color):
+    if color == board.WHITE:
+        return board.white_pieces
+    return board.black_pieces
+
+
+def Evaluate(board, color):
+    """Static score of board for color, who is to move."""
+    winner = board.CheckForWinner()
+    if winner:
+        return WIN if winner == color else -WIN
+    opponent = board.NextColor(color)
+    return (PIECE * (Reserve(board, color) - Reserve(board, opponent)) +
+            THREAT * (Threats(board, color) - Threats(board, opponent)))
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Engine(object):
+    """Scores moves by iterative deepening negamax search.
+
+    Args:
+        depth: deepest search, in plies.  Depth 1 scores each move by the
+            static evaluation of the position it leads to.
+        max_nodes: node budget per position, or None for no limit.  When
+            a deeper iteration runs out of budget the scores of the last
+            completed depth are used.
+    """
+
+    def __init__(self, depth=2, max_nodes=None):
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def _Children(self, board, color):
+        """Yield (move, board) for each move color can make."""
+        for move in board.LegalMoves():
+            child = board.Copy()
+            child.Move(move[0], move[1], move[2], color)
+            # The server resolves crossing rows with the first option, so
+            # moves are scored by the captures that actually happen.
+            child.Resolve(color)
+            yield move, child
+
+    def _Search(self, board, color, depth, alpha, beta):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded()
+        if depth == 0 or board.CheckForWinner():
+            return Evaluate(board, color)
+        opponent = board.NextColor(color)
+        best = None
+        for move, child in self._Children(board, color):
+            score = -self._Search(child, opponent, depth - 1, -beta, -alpha)
+            if best is None or score > best:
+                best = score
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+        if best is None:
+            # No legal moves left, which loses.
+            return -WIN
+        return best
+
+    def ScoreMoves(self, board, color):
+        """Map each legal move of color on board to its score.
+
+        Returns an empty dict if color cannot move.
+        """
+        self.nodes = 0
+        opponent = board.NextColor(color)
+        children = list(self._Children(board, color))
+        scores = {}
+        for depth in range(1, self.depth + 1):
+            depth_scores = {}
+            try:
+                for move, child in children:
+                    depth_scores[move] = -self._Search(
+                        child, opponent, depth - 1, -WIN - 1, WIN + 1)
+            except BudgetExceeded:
+                if not scores:
+                    # Not even one complete depth, fall back to static
+                    # scores so that every move still gets one.
+                    for move, child in children:
+                        scores[move] = -Evaluate(child, opponent)
+                break
+            scores = depth_scores
+        return scores
+
+    def BestMove(self, board, color):
+        """Return (move, score) of the best move, or (None, -WIN)."""
+        scores = self.ScoreMoves(board, color)
+        if not scores:
+            return None, -WIN
+        move = max(sorted(scores), key=lambda m: scores[m])
+        return move, scores[move]
+
+
+# Engines selectable by name, each built from (depth, max_nodes).
+ENGINES = {
+    'static': lambda depth, max_nodes: Engine(1, max_nodes),
+    'negamax': Engine,
+}
+
+
+def MakeEngine(name, depth=2, max_nodes=None):
+    """Build one of the ENGINES by name."""
+    if name not in ENGINES:
+        raise ValueError('unknown engine %r' % name)
+    return ENGINES[name](depth, max_nodes)
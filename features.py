@@ -0,0 +1,147 @@
+"""
+Position features of gipf.Board for evaluation and training.
+
+Boards are flattened into rows of a NumPy array, one column per spot of
+Board.pieces plus a trailing always-empty pad column, and every feature is
+computed for the whole batch at once through precomputed index arrays
+over the board lines.  FEATURE_NAMES names the columns of the matrix
+returned by Features:
+
+    white_reserve, black_reserve, reserve_balance
+    white_on_board, black_on_board
+    white_center, black_center      pieces weighted by closeness to center
+    white_threats, black_threats    4 cells in a line: 3 own and a gap
+    white_line_<k>, black_line_<k>  pieces on each of the 21 lines
+"""
+
+import itertools
+
+import numpy
+
+import gipf
+
+_board = gipf.Board()
+
+# Offset of each Board.pieces row in the flattened board.
+_ROW_OFFSETS = numpy.cumsum([0] + [len(row) for row in _board.pieces])
+NUM_SPOTS = int(_ROW_OFFSETS[-1])
+PAD = NUM_SPOTS
+
+
+def _Flat(letter, number):
+    return int(_ROW_OFFSETS[letter]) + number
+
+
+def _BuildLines():
+    """Flat indices of the cells of each line, padded with PAD."""
+    lines = [[_Flat(i, j) for i, j in gipf.ROW_CELLS[row]]
+             for row in gipf.CAPTURE_ROWS]
+    width = max(len(line) for line in lines)
+    return numpy.array([line + [PAD] * (width - len(line))
+                        for line in lines], dtype=numpy.intp)
+
+
+def _BuildWindows():
+    """Flat indices of every 4 consecutive cells along a line."""
+    windows = []
+    for row in gipf.CAPTURE_ROWS:
+        cells = [_Flat(i, j) for i, j in gipf.ROW_CELLS[row]]
+        for k in range(len(cells) - 3):
+            windows.append(cells[k:k + 4])
+    return numpy.array(windows, dtype=numpy.intp)
+
+
+def _BuildCenterWeights():
+    """Weight of each flat spot, 3 at the center down to 0 on the rim."""
+    center = (4, 4)
+    distance = {center: 0}
+    frontier = [center]
+    while frontier:
+        next_frontier = []
+        for letter, number in frontier:
+            for direction in range(1, 7):
+                cell = _board.NextSpot(letter, number, direction)
+                if _board._InBoard(*cell) and cell not in distance:
+                    distance[cell] = distance[(letter, number)] + 1
+                    next_frontier.append(cell)
+        frontier = next_frontier
+    weights = numpy.zeros(NUM_SPOTS + 1, dtype=numpy.float32)
+    for (letter, number), d in distance.items():
+        weights[_Flat(letter, number)] = 3 - d
+    return weights
+
+# LINES[k] and WINDOWS[k] index the flattened board.
+LINES = _BuildLines()
+WINDOWS = _BuildWindows()
+CENTER_WEIGHTS = _BuildCenterWeights()
+
+FEATURE_NAMES = (['white_reserve', 'black_reserve', 'reserve_balance',
+                  'white_on_board', 'black_on_board',
+                  'white_center', 'black_center',
+                  'white_threats', 'black_threats'] +
+                 ['white_line_%d' % k for k in range(len(LINES))] +
+                 ['black_line_%d' % k for k in range(len(LINES))])
+
+
+def Encode(boards):
+    """Flatten boards into (spots, reserves) arrays.
+
+    spots is an (N, NUM_SPOTS + 1) int8 array of piece colors with the pad
+    column last, and reserves an (N, 2) array of white and black reserves.
+    """
+    boards = list(boards)
+    n = len(boards)
+    flat = numpy.fromiter(
+        itertools.chain.from_iterable(
+            itertools.chain.from_iterable(board.pieces) for board in boards),
+        dtype=numpy.int8, count=n * NUM_SPOTS)
+    spots = numpy.zeros((n, NUM_SPOTS + 1), dtype=numpy.int8)
+    spots[:, :NUM_SPOTS] = flat.reshape(n, NUM_SPOTS)
+    reserves = numpy.array([(board.white_pieces, board.black_pieces)
+                            for board in boards],
+                           dtype=numpy.float32).reshape(n, 2)
+    return spots, reserves
+
+
+def FeaturesFromArrays(spots, reserves):
+    """Feature matrix for boards already flattened by Encode."""
+    white = (spots == gipf.Board.WHITE)
+    black = (spots == gipf.Board.BLACK)
+    empty = (spots == 0)
+
+    white_lines = white[:, LINES].sum(axis=2)
+    black_lines = black[:, LINES].sum(axis=2)
+
+    window_empty = empty[:, WINDOWS].sum(axis=2) == 1
+    white_threats = ((white[:, WINDOWS].sum(axis=2) == 3) &
+                     window_empty).sum(axis=1)
+    black_threats = ((black[:, WINDOWS].sum(axis=2) == 3) &
+                     window_empty).sum(axis=1)
+
+    columns = [reserves[:, 0],
+               reserves[:, 1],
+               reserves[:, 0] - reserves[:, 1],
+               white.sum(axis=1),
+               black.sum(axis=1),
+               white.dot(CENTER_WEIGHTS),
+               black.dot(CENTER_WEIGHTS),
+               white_threats,
+               black_threats]
+    n = spots.shape[0]
+    features = numpy.empty((n, len(FEATURE_NAMES)), dtype=numpy.float32)
+    for k, column in enumerate(columns):
+        features[:, k] = column
+    first_line = len(columns)
+    features[:, first_line:first_line + len(LINES)] = white_lines
+    features[:, first_line + len(LINES):] = black_lines
+    return features
+
+
+def Features(boards):
+    """(N, len(FEATURE_NAMES)) float32 feature matrix of boards.
+
+    boards may be a single gipf.Board or any iterable of them.
+    """
+    if isinstance(boards, gipf.Board):
+        boards = [boards]
+    return FeaturesFromArrays(*Encode(boards))
@@ -2,7 +2,6 @@
 
 import math
 import numpy
-import string
 
 class Board(object):
     """
@@ -16,6 +15,35 @@ class Board(object):
     WHITE = 1
     BLACK = 2
 
+    # Directions a piece may be pushed in from each starting dot.
+    _DIRECTION_MAP = {
+        (0, 0): [2],
+        (1, 0): [1, 2],
+        (2, 0): [1, 2],
+        (3, 0): [1, 2],
+        (4, 0): [1],
+        (5, 0): [6, 1],
+        (6, 0): [6, 1],
+        (7, 0): [6, 1],
+        (8, 0): [6],
+        (8, 1): [5, 6],
+        (8, 2): [5, 6],
+        (8, 3): [5, 6],
+        (8, 4): [5],
+        (7, 5): [4, 5],
+        (6, 6): [4, 5],
+        (5, 7): [4, 5],
+        (4, 8): [4],
+        (3, 7): [3, 4],
+        (2, 6): [3, 4],
+        (1, 5): [3, 4],
+        (0, 4): [3],
+        (0, 3): [2, 3],
+        (0, 2): [2, 3],
+        (0, 1): [2, 3]
+        }
+    _ENTRY_SPOTS = sorted(_DIRECTION_MAP.keys())
+
     def __init__(self):
         self.black_pieces = 15
         self.white_pieces = 15
@@ -57,6 +85,36 @@ class Board(object):
             [7, 0, 1],
             [8, 0, 1]]
 
+    def Copy(self):
+        """Return an independent copy of this board."""
+        board = Board.__new__(Board)
+        board.black_pieces = self.black_pieces
+        board.white_pieces = self.white_pieces
+        board.pieces = [list(row) for row in self.pieces]
+        board.rows = self.rows
+        return board
+
+    def Pack(self):
+        """Compact snapshot of the board as a string, see Unpack."""
+        data = bytearray((self.white_pieces, self.black_pieces))
+        for row in self.pieces:
+            data.extend(row)
+        return str(data)
+
+    def Unpack(self, data):
+        """Restore the board from a Pack snapshot."""
+        data = bytearray(data)
+        self.white_pieces = data[0]
+        self.black_pieces = data[1]
+        k = 2
+        for row in self.pieces:
+            row[:] = data[k:k + len(row)]
+            k += len(row)
+
+    def EntrySpots(self):
+        """All (letter, number) dots a piece can be pushed in from."""
+        return list(self._ENTRY_SPOTS)
+
     def _InBoard(self, letter, number):
         """Returns true if the given (letter, number) pair is in the board."""
         if letter < 1 or letter > 7:
@@ -80,33 +138,107 @@ class Board(object):
             last_color = cur_color
             next_i, next_j = self.NextSpot(next_i, next_j, direction)
 
-    def _ResolveRowCapture(self, row, profile, color):
+    def _ResolveRowCapture(self, capture):
         """Handle capturing a row.
-        
-        Remove captured pieces from the board and return them
-        to the capturing player.
+
+        Remove captured pieces from the board and return the capturer's
+        own pieces to their reserve.
 
         Args:
-            row: tuple (number, letter, direction) that identifies
-                one of the rows on the board.
-            profile: an array of True/False that describes whether or not
-                a piece on the board has been captured.
-            color: the color of the capturer
+            capture: tuple (row, start, end, color) where row indexes
+                ROW_CELLS, ROW_CELLS[row][start:end] are the captured
+                cells and color is the color of the capturer.
         """
-        k = 0
-        i, j = row[0], row[1]
-        next_i, next_j = self.NextSpot(i, j, row[2])            
-        while self._InBoard(next_i, next_j):
-            if profile[k]:
-                if self.pieces[next_i][next_j] == self.WHITE:
-                    if color == self.WHITE:
-                        self.white_pieces += 1
-                elif self.pieces[next_i][next_j] == self.BLACK:
-                    if color == self.BLACK:
-                        self.black_pieces += 1
-                self.pieces[next_i][next_j] = 0
-            k += 1
-            next_i, next_j = self.NextSpot(next_i, next_j, row[2])
+        row, start, end, color = capture
+        for i, j in ROW_CELLS[row][start:end]:
+            if self.pieces[i][j] == color:
+                if color == self.WHITE:
+                    self.white_pieces += 1
+                else:
+                    self.black_pieces += 1
+            self.pieces[i][j] = 0
+
+    def _RowCaptures(self):
+        """Find every run of 4 or more pieces of one color in a row.
+
+        Returns a list of (row, start, end, color) captures, ordered by
+        row.  The captured extent is the run together with all pieces
+        adjoining it in the row, up to the first empty cell on each side.
+        """
+        captures = []
+        pieces = self.pieces
+        for row in CAPTURE_ROWS:
+            colors = [pieces[i][j] for i, j in ROW_CELLS[row]]
+            n = len(colors)
+            k = 0
+            while k < n:
+                color = colors[k]
+                run_end = k + 1
+                while run_end < n and colors[run_end] == color:
+                    run_end += 1
+                if color and run_end - k >= 4:
+                    start = k
+                    while start > 0 and colors[start - 1]:
+                        start -= 1
+                    end = run_end
+                    while end < n and colors[end]:
+                        end += 1
+                    captures.append((row, start, end, color))
+                k = run_end
+        return captures
+
+    def _CaptureSequences(self, captures, color):
+        """All distinct ways for color to take its rows among captures.
+
+        Rows that do not share a captured cell are simply all taken.  When
+        rows cross inside their captured extents, taking one may break the
+        other, so each choice is tried in turn and the rows that are still
+        standing afterwards are resolved recursively.
+        """
+        own = [capture for capture in captures if capture[3] == color]
+        if not own:
+            return [()]
+        if not _CapturesCross(own):
+            return [tuple(own)]
+        sequences = []
+        seen = set()
+        for capture in own:
+            board = self.Copy()
+            board._ResolveRowCapture(capture)
+            for rest in board._CaptureSequences(board._RowCaptures(), color):
+                sequence = (capture,) + rest
+                key = _CapturedCells(sequence)
+                if key not in seen:
+                    seen.add(key)
+                    sequences.append(sequence)
+        return sequences
+
+    def CaptureOptions(self, color):
+        """Every distinct way to resolve the board after color has moved.
+
+        The player who moved takes their rows first, then the opponent
+        takes any rows of theirs still on the board.  Each option is a
+        tuple of (row, start, end, color) captures to apply in order, and
+        can be handed to Resolve.  A board with nothing to capture has the
+        single empty option.
+        """
+        captures = self._RowCaptures()
+        if not captures:
+            return [()]
+        opponent = self.NextColor(color)
+        options = []
+        for own in self._CaptureSequences(captures, color):
+            if own:
+                board = self.Copy()
+                for capture in own:
+                    board._ResolveRowCapture(capture)
+                remaining = board._RowCaptures()
+            else:
+                board = self
+                remaining = captures
+            for theirs in board._CaptureSequences(remaining, opponent):
+                options.append(own + theirs)
+        return options
 
     def CanMove(self, letter, number, direction):
         """Can we move from (letter, number) in direction."""
@@ -120,6 +252,15 @@ class Board(object):
             next_i, next_j = self.NextSpot(next_i, next_j, direction)
         return False
 
+    def LegalMoves(self):
+        """Return all (letter, number, direction) moves that CanMove allows."""
+        moves = []
+        for letter, number in self._ENTRY_SPOTS:
+            for direction in self.PossibleDirections(letter, number):
+                if self.CanMove(letter, number, direction):
+                    moves.append((letter, number, direction))
+        return moves
+
     def Move(self, letter, number, direction, color):
         if self.CanMove(letter, number, direction):
             self.pieces[letter][number] = color
@@ -132,40 +273,23 @@ class Board(object):
         else:
             return False
 
-    def Resolve(self, color):
-        def GetRowColors(row):
-            colors = []
-            i, j = row[0], row[1]
-            next_i, next_j = self.NextSpot(i, j, row[2])            
-            while self._InBoard(next_i, next_j):
-                colors.append(self.pieces[next_i][next_j])
-                next_i, next_j = self.NextSpot(next_i, next_j, row[2])
-            return colors
-        # Gather all rows with 4-sets and the profile of the capture
-        captures = []
-        white_string = ''.join(map(str, [self.WHITE]*4))
-        black_string = ''.join(map(str, [self.BLACK]*4))
-        for row in self.rows:
-            colors = GetRowColors(row)
-            colors_string = ''.join(map(str, colors))
-            if white_string in colors_string:
-                capture_color = self.WHITE
-                begin, end = colors_string.split(white_string)
-            elif black_string in colors_string:
-                capture_color = self.BLACK
-                begin, end = colors_string.split(black_string)
-            else:
-                continue
-            color_chars = str(self.WHITE) + str(self.BLACK)
-            begin = string.rstrip(begin, color_chars)
-            end = string.lstrip(end, color_chars)
-            capture_length = len(colors) - len(begin) - len(end)
-            capture_profile = [0]*len(begin) + [1]*capture_length + [0]*len(end)
-            captures.append([row, capture_profile, capture_color])
-        # 1 match is easy to resolve.
-        if len(captures) == 1:
-            self._ResolveRowCapture(*captures[0])
-        
+    def Resolve(self, color, option=None):
+        """Capture the rows formed after color moved.
+
+        Args:
+            color: the color of the player who just moved.
+            option: one of CaptureOptions(color).  Defaults to the first
+                option, which is the only one unless rows cross.
+
+        Returns:
+            The option that was applied.
+        """
+        if option is None:
+            option = self.CaptureOptions(color)[0]
+        for capture in option:
+            self._ResolveRowCapture(capture)
+        return option
+
     def PossibleDirections(self, letter, number):
         """
         Directions go from 1 through 6:
@@ -176,33 +300,7 @@ class Board(object):
                       5   |   3
                           4
         """
-        dir_map = {
-            (0, 0): [2],
-            (1, 0): [1, 2],
-            (2, 0): [1, 2],
-            (3, 0): [1, 2],
-            (4, 0): [1],
-            (5, 0): [6, 1],
-            (6, 0): [6, 1],
-            (7, 0): [6, 1],
-            (8, 0): [6],
-            (8, 1): [5, 6],
-            (8, 2): [5, 6],
-            (8, 3): [5, 6],
-            (8, 4): [5],
-            (7, 5): [4, 5],
-            (6, 6): [4, 5],
-            (5, 7): [4, 5],
-            (4, 8): [4],
-            (3, 7): [3, 4],
-            (2, 6): [3, 4],
-            (1, 5): [3, 4],
-            (0, 4): [3],
-            (0, 3): [2, 3],
-            (0, 2): [2, 3],
-            (0, 1): [2, 3]
-            }
-        return dir_map[(letter, number)]
+        return self._DIRECTION_MAP[(letter, number)]
 
     def NextColor(self, color):
         if color == self.WHITE:
@@ -243,3 +341,61 @@ class Board(object):
             return self.WHITE
         else:
             return None
+
+
+def _BuildRowTables():
+    """Cells of every row, and where each pair of rows crosses."""
+    board = Board()
+    row_cells = []
+    for letter, number, direction in board.rows:
+        cells = []
+        i, j = board.NextSpot(letter, number, direction)
+        while board._InBoard(i, j):
+            cells.append((i, j))
+            i, j = board.NextSpot(i, j, direction)
+        row_cells.append(tuple(cells))
+    row_crossings = []
+    for row, cells in enumerate(row_cells):
+        crossings = {}
+        for other, other_cells in enumerate(row_cells):
+            if other == row:
+                continue
+            for k, cell in enumerate(cells):
+                if cell in other_cells:
+                    crossings[other] = (k, other_cells.index(cell))
+        row_crossings.append(crossings)
+    return tuple(row_cells), tuple(row_crossings)
+
+# ROW_CELLS[row] lists the (letter, number) cells of Board.rows[row] in
+# order, and ROW_CROSSINGS[row][other] is the (index in row, index in other)
+# pair of the cell where two rows cross.
+ROW_CELLS, ROW_CROSSINGS = _BuildRowTables()
+
+# Rows long enough to hold a capture.
+CAPTURE_ROWS = tuple(row for row, cells in enumerate(ROW_CELLS)
+                     if len(cells) >= 4)
+# Cells read by one _RowCaptures scan.
+CAPTURE_ROW_CELLS = sum(len(ROW_CELLS[row]) for row in CAPTURE_ROWS)
+
+
+def _CapturesCross(captures):
+    """True if any two captures share a captured cell."""
+    for a in range(len(captures)):
+        row, start, end = captures[a][:3]
+        crossings = ROW_CROSSINGS[row]
+        for b in range(a + 1, len(captures)):
+            other, other_start, other_end = captures[b][:3]
+            if other not in crossings:
+                continue
+            k, other_k = crossings[other]
+            if start <= k < end and other_start <= other_k < other_end:
+                return True
+    return False
+
+
+def _CapturedCells(sequence):
+    """The set of cells emptied by a sequence of captures."""
+    cells = set()
+    for row, start, end, color in sequence:
+        cells.update(ROW_CELLS[row][start:end])
+    return frozenset(cells)
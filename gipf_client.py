@@ -14,6 +14,8 @@ pygame.init()
 
 import gipf
 import gui
+import records
+import replay
 
 class Events(object):
     """User events in the pygame loop."""
@@ -25,6 +27,7 @@ class ServerConnection(object):
     def __init__(self):
         self.HOST, self.PORT = "localhost", 2222
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._pending = ''
 
     def __del__(self):
         self._socket.send(messages.Shutdown())
@@ -55,9 +58,16 @@ class ServerConnection(object):
         self._socket.send(msg.Pack())
         
     def Receive(self):
-        data = self._socket.recv(1024)
-        msg = messages.Unpack(data)
-        return msg
+        """Block until at least one full message arrives, return them all."""
+        while True:
+            data = self._socket.recv(1024)
+            if not data:
+                raise socket.error('server closed the connection')
+            self._pending += data
+            msgs, consumed = messages.UnpackAll(self._pending)
+            self._pending = self._pending[consumed:]
+            if msgs:
+                return msgs
 
 
 class ServerListener(threading.Thread):
@@ -69,12 +79,13 @@ class ServerListener(threading.Thread):
 
     def run(self):
         while True:
-            msg = self._server_conn.Receive()
-            network_event = pygame.event.Event(Events.NETWORKMSG, msg = msg)
-            # I'm under the impression that event.post is thread-safe,
-            # though I'm not completely certain.  I know that any sort
-            # of event get/poll should only happen in the main thread.
-            pygame.event.post(network_event)
+            for msg in self._server_conn.Receive():
+                network_event = pygame.event.Event(Events.NETWORKMSG,
+                                                   msg = msg)
+                # I'm under the impression that event.post is thread-safe,
+                # though I'm not completely certain.  I know that any sort
+                # of event get/poll should only happen in the main thread.
+                pygame.event.post(network_event)
 
 
 class Game(object):
@@ -190,6 +201,14 @@ class Game(object):
                 self.Redraw()
             else:
                 print 'FATAL: server gave bum move'
+        elif isinstance(msg, messages.SyncBoard):
+            # We rejoined a game in progress.
+            self._board.Unpack(msg.board)
+            if msg.to_move == self._color:
+                self._state = self.PLACING_PIECE
+            else:
+                self._state = self.WAITING_FOR_PLAYER
+            self.Redraw()
         elif isinstance(msg, messages.DeclareWinner):
             self._state = self.GAME_OVER
             self._winner = msg.winner
@@ -262,10 +281,123 @@ class Game(object):
                         print 'INVALID MOVE'            
 
 
+class ReplayViewer(object):
+    """Steps, seeks and scrubs through a recorded game.
+
+    Keys: left/right step one ply, up/down jump 10, home/end go to the
+    ends.  Click or drag on the bar at the bottom to scrub.
+    """
+
+    BAR_MARGIN = 25
+    BAR_HEIGHT = 12
+
+    def __init__(self, game_replay, title=''):
+        self._window = pygame.display.set_mode((800,600))
+        self._replay = game_replay
+        self._title = title
+        self._ply = 0
+        self._draw_board = gui.DrawableBoard(game_replay.Board(0),
+                                             self._window)
+        self._scrubbing = False
+        self.Redraw()
+
+    def _BarRect(self):
+        window_x, window_y = self._window.get_size()
+        return pygame.Rect(self.BAR_MARGIN,
+                           window_y - self.BAR_MARGIN - self.BAR_HEIGHT,
+                           window_x - 2*self.BAR_MARGIN,
+                           self.BAR_HEIGHT)
+
+    def Seek(self, ply):
+        ply = max(0, min(ply, len(self._replay) - 1))
+        if ply != self._ply:
+            self._ply = ply
+            self._draw_board.board = self._replay.Board(ply)
+            self.Redraw()
+
+    def SeekToMouse(self, pos):
+        bar = self._BarRect()
+        fraction = float(pos[0] - bar.left) / max(bar.width, 1)
+        self.Seek(int(round(fraction * (len(self._replay) - 1))))
+
+    def Redraw(self):
+        surface = pygame.display.get_surface()
+        surface.fill((0, 0, 0))
+        self._draw_board.Draw()
+
+        board = self._draw_board.board
+        gui.DrawText("White: %d"%board.white_pieces, 28, (25, 50))
+        gui.DrawText("Black: %d"%board.black_pieces,
+                     28, (self._window.get_size()[0]-100, 50))
+        gui.DrawText("%s  ply %d / %d" % (self._title, self._ply,
+                                          len(self._replay) - 1),
+                     28, (25, 15))
+
+        bar = self._BarRect()
+        pygame.draw.rect(self._window, (100, 100, 100), bar)
+        played = bar.width * self._ply / max(len(self._replay) - 1, 1)
+        pygame.draw.rect(self._window, (0, 255, 0),
+                         pygame.Rect(bar.left, bar.top, played, bar.height))
+        pygame.display.flip()
+
+    def Run(self):
+        """ Viewer loop """
+        steps = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1,
+                 pygame.K_DOWN: -10, pygame.K_UP: 10}
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                return
+            elif event.type == pygame.KEYDOWN:
+                if event.key in steps:
+                    self.Seek(self._ply + steps[event.key])
+                elif event.key == pygame.K_HOME:
+                    self.Seek(0)
+                elif event.key == pygame.K_END:
+                    self.Seek(len(self._replay) - 1)
+                elif event.key in (pygame.K_q, pygame.K_ESCAPE):
+                    return
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if self._BarRect().inflate(0, 2*self.BAR_HEIGHT).collidepoint(
+                        event.pos):
+                    self._scrubbing = True
+                    self.SeekToMouse(event.pos)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                self._scrubbing = False
+            elif event.type == pygame.MOUSEMOTION and self._scrubbing:
+                # Only the latest of a burst of motion events matters, so
+                # drop the rest rather than drawing every position.
+                motion = pygame.event.get(pygame.MOUSEMOTION)
+                pos = motion[-1].pos if motion else event.pos
+                self.SeekToMouse(pos)
+
+
+def RunReplay(argv):
+    """gipf_client.py --replay games.log [game_id]"""
+    if len(argv) < 3:
+        print 'usage: gipf_client.py --replay gamesfile [game_id]'
+        sys.exit(1)
+    record = None
+    for game in records.ReadGames(argv[2]):
+        if len(argv) < 4 or game.game_id == argv[3]:
+            record = game
+            break
+    if record is None:
+        print 'No such game in', argv[2]
+        sys.exit(1)
+    viewer = ReplayViewer(replay.Replay(record.moves), record.game_id)
+    viewer.Run()
+
+
 if __name__=="__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--replay':
+        RunReplay(sys.argv)
+        sys.exit(0)
+
     # Get the player name from command line args.
     if len(sys.argv) < 2:
         print 'usage: gipf_client.py playername [server]'
+        print '       gipf_client.py --replay gamesfile [game_id]'
         sys.exit(1)
     player_name = sys.argv[1]
 
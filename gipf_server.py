@@ -3,11 +3,23 @@
 # TODO:
 #   factor out client connection from server
 
+import argparse
+import clock
+import errno
 import gipf
+import itertools
 import messages
+import os
+import profiler
 import random
+import records
+import signal
+import snapshot
 import socket
+import sys
 import threading
+import time
+import traces
 
 class GameState(object):
     """State of GIPF game and players joining, shared among threads"""
@@ -16,137 +28,700 @@ class GameState(object):
     WAITING_FOR_PLAYERS = 1
     PLAYING = 2
 
-    def __init__(self):
+    def __init__(self, game_id, record_path=None, scheduler=None,
+                 time_control=None, on_finish=None, rng=random):
         self._state = self.WAITING_FOR_PLAYERS
         self._player_list = []
         self._player_list_lock = threading.Lock()
         self._game_start_event = threading.Event()
+        # Colors by player session, and the (player_name, color) of each
+        # seat once colors are known.  Names may repeat, so they only
+        # matter for rejoining a restored game.
         self._colors = {}
+        self._seats = []
         self.board = gipf.Board()
         self.board_lock = threading.Lock()
+        self.game_id = game_id
+        self.moves = []
+        self.to_move = gipf.Board.WHITE
+        self.finished = False
+        self.clock = None
+        self._record_path = record_path
+        self._scheduler = scheduler
+        self._time_control = time_control
+        self._on_finish = on_finish
+        # Picks the colors, a seeded random.Random for repeatable games.
+        self._rng = rng
+        # Set when the game was brought back from a snapshot.
+        self.restored = False
+        self._restored_clocks = None
 
     def _StartGame(self):
-        # Assign colors to players
-        if random.random() > 0.5:
-            self._colors[self._player_list[0][0]] = 1
-            self._colors[self._player_list[1][0]] = 2
-        else:
-            self._colors[self._player_list[0][0]] = 2
-            self._colors[self._player_list[1][0]] = 1            
+        # Assign colors to players, unless they are rejoining a game.
+        if not self.restored:
+            first, second = [player for _, player in self._player_list]
+            if self._rng.random() > 0.5:
+                self._colors[first] = 1
+                self._colors[second] = 2
+            else:
+                self._colors[first] = 2
+                self._colors[second] = 1
+            self._seats = [(player_name, self._colors[player])
+                           for player_name, player in self._player_list]
+        if self._scheduler is not None:
+            base, increment = self._time_control
+            self.clock = clock.GameClock(self._scheduler, base, increment,
+                                         self._OnFlag)
+            if self._restored_clocks:
+                self.clock.SetRemaining(gipf.Board.WHITE,
+                                        self._restored_clocks[0])
+                self.clock.SetRemaining(gipf.Board.BLACK,
+                                        self._restored_clocks[1])
+            self.clock.Start(self.to_move)
         self._game_start_event.set()
 
     def AddPlayer(self, player_name, handler):
         with self._player_list_lock:
             if len(self._player_list) > 1:
                 return False
+            if self.restored:
+                color = self._FreeSeat(player_name)
+                if color is None:
+                    return False
+                self._colors[handler] = color
             self._player_list.append((player_name, handler))
             if len(self._player_list) == 2:
                 self._StartGame()
         return True
 
-    def WaitForGameStart(self, player_name):
-        self._game_start_event.wait()
-        color = self._colors[player_name]
-        print 'START: Player', player_name, 'is color', color
-        return color
+    def AnnounceStart(self):
+        """Tell both players their colors.
+
+        Called once the game is full by whoever filled it, outside the
+        lobby lock, so that a slow connection cannot hold up the lobby.
+        """
+        for player_name, player in self._player_list:
+            color = self._colors[player]
+            print 'START: Player', player_name, 'is color', color
+            player.GameStarted(self, color)
+
+    def RemovePlayer(self, player):
+        """Give up the seat of a player before the game starts."""
+        with self._player_list_lock:
+            self._player_list = [entry for entry in self._player_list
+                                 if entry[1] is not player]
+            self._colors.pop(player, None)
+
+    def _FreeSeat(self, player_name):
+        """Color of a seat of player_name nobody has taken back yet."""
+        taken = self._colors.values()
+        for seat_name, color in self._seats:
+            if seat_name == player_name and color not in taken:
+                return color
+        return None
+
+    def PlayerColor(self, player):
+        return self._colors[player]
+
+    def Full(self):
+        with self._player_list_lock:
+            return len(self._player_list) == 2
+
+    def Started(self):
+        return self._game_start_event.is_set()
+
+    def Snapshot(self):
+        """Copy the game into a snapshot.GameSnapshot.
+
+        Only the board and a few counters are copied under board_lock.
+        The move list is only ever appended to, so its first moves can be
+        encoded after the lock is released.
+        """
+        with self.board_lock:
+            board = self.board.Pack()
+            to_move = self.to_move
+            num_moves = len(self.moves)
+            clocks = self._restored_clocks
+            if self.clock:
+                clocks = (self.clock.Remaining(gipf.Board.WHITE),
+                          self.clock.Remaining(gipf.Board.BLACK))
+        return snapshot.GameSnapshot(self.game_id,
+                                     to_move,
+                                     clocks,
+                                     board,
+                                     sorted(self._seats),
+                                     snapshot.PackMoves(
+                                         self.moves[:num_moves]))
+
+    def Restore(self, game):
+        """Pick up a game from a snapshot.GameSnapshot.
+
+        The game starts again once both of its players have rejoined.
+        """
+        self.restored = True
+        self.board.Unpack(game.board)
+        self.to_move = game.to_move
+        self.moves = snapshot.UnpackMoves(game.moves)
+        self._seats = list(game.players)
+        self._restored_clocks = game.clocks
+
+    def EndTurn(self, color):
+        """Hand the turn over after color moved.  Call with board_lock."""
+        self.to_move = self.board.NextColor(color)
+        if self.clock:
+            self.clock.Press(color)
+
+    def Finish(self, winner):
+        """End the game and announce the winner.  Call with board_lock."""
+        self.finished = True
+        if self.clock:
+            self.clock.Stop()
+        if self._on_finish:
+            self._on_finish(self)
+        self.RecordGame(winner)
+        win_msg = messages.DeclareWinner()
+        win_msg.winner = winner
+        self.Broadcast(win_msg)
+        for player in self._player_list:
+            player[1].GameFinished()
+
+    def Forfeit(self, color):
+        """color left the game, so the opponent wins."""
+        with self.board_lock:
+            if self.finished:
+                return
+            print 'FORFEIT: color', color, 'left the game'
+            self.Finish(self.board.NextColor(color))
+
+    def _OnFlag(self, color):
+        """The clock of color ran out, from the clock scheduler thread.
+
+        The one scheduler thread drives every clock on the server, so it
+        only marks the game finished.  Announcing the result sends to
+        both players, which can block on a client that stopped reading,
+        and is left to a thread of its own.
+        """
+        with self.board_lock:
+            if self.finished or self.clock.running != color:
+                return
+            if self.clock.Remaining(color) > 0:
+                # Time was added since this deadline was set, so wait for
+                # the rest of it.
+                self.clock.Start(color)
+                return
+            self.finished = True
+        flagged = threading.Thread(target=self._Flagged, args=(color,))
+        flagged.daemon = True
+        flagged.start()
+
+    def _Flagged(self, color):
+        print 'TIMEOUT: color', color, 'ran out of time'
+        with self.board_lock:
+            self.Finish(self.board.NextColor(color))
+        for player in self._player_list:
+            player[1].Stop()
+
+    def RecordGame(self, winner):
+        """Append the finished game to the records file, if we keep one."""
+        if self._record_path:
+            records.AppendGame(self._record_path,
+                               records.GameRecord(self.game_id,
+                                                  self.moves,
+                                                  winner))
 
     # TODO(piotrf): move this function to networking class
     def Broadcast(self, msg):
         for player in self._player_list:
             player[1].Send(msg)
 
+
+class GameLobby(object):
+    """Pairs up joining players, starting a new game whenever one fills."""
+
+    def __init__(self, record_path=None, time_control=None, seed=None):
+        self._lock = threading.Lock()
+        self._waiting = None
+        self._seed = seed
+        # The seed only picks colors.  Game ids stay unique across runs,
+        # since records, snapshots and datasets are keyed by them.
+        self._game_prefix = '%d' % (time.time() * 1000)
+        self._game_numbers = itertools.count(1)
+        self._record_path = record_path
+        self._time_control = time_control
+        self._scheduler = None
+        if time_control:
+            # One scheduler thread drives the clocks of every game.
+            self._scheduler = clock.ClockScheduler()
+            self._scheduler.start()
+        # Games in progress by id, and restored games by the names of the
+        # players who have yet to rejoin them.
+        self._games = {}
+        self._rejoining = {}
+
+    def _NewGame(self, game_id, rng=random):
+        if game_id in self._games:
+            raise ValueError('game %s already exists' % game_id)
+        game_state = GameState(game_id,
+                               self._record_path,
+                               self._scheduler,
+                               self._time_control,
+                               self._Forget,
+                               rng)
+        self._games[game_id] = game_state
+        return game_state
+
+    def _Forget(self, game_state):
+        with self._lock:
+            self._games.pop(game_state.game_id, None)
+
+    def Join(self, player_name, player):
+        """Add a player to their restored game or the waiting game.
+
+        Returns the game the player joined and whether this join filled
+        it, in which case the caller should AnnounceStart() the game.
+        """
+        with self._lock:
+            rejoining = self._rejoining.get(player_name)
+            if rejoining:
+                game_state = rejoining.pop(0)
+                if not rejoining:
+                    del self._rejoining[player_name]
+            else:
+                if self._waiting is None:
+                    number = next(self._game_numbers)
+                    while '%s-%d' % (self._game_prefix, number) in self._games:
+                        # Taken by a restored game.
+                        number = next(self._game_numbers)
+                    rng = random
+                    if self._seed is not None:
+                        # Each game gets its own stream, so its colors
+                        # only depend on the seed and the order of joins.
+                        rng = random.Random(self._seed * 2 ** 32 + number)
+                    self._waiting = self._NewGame(
+                        '%s-%d' % (self._game_prefix, number), rng)
+                game_state = self._waiting
+            game_state.AddPlayer(player_name, player)
+            filled = game_state.Full()
+            if game_state is self._waiting and filled:
+                self._waiting = None
+        return game_state, filled
+
+    def Leave(self, game_state, player):
+        """player left game_state.
+
+        A started game is forfeited to the opponent.  Otherwise the player
+        just gives up their seat, and a restored game waits for them to
+        rejoin again.
+        """
+        with self._lock:
+            if not game_state.Started():
+                game_state.RemovePlayer(player)
+                if game_state.restored:
+                    self._rejoining.setdefault(player.player_name, []).append(
+                        game_state)
+                return
+        game_state.Forfeit(game_state.PlayerColor(player))
+
+    def Snapshot(self):
+        """GameSnapshots of every started or restored game."""
+        with self._lock:
+            games = [game_state for game_state in self._games.values()
+                     if game_state.Started() or game_state.restored]
+        return [game_state.Snapshot() for game_state in games]
+
+    def Restore(self, games):
+        """Bring back the snapshot.GameSnapshots in games.
+
+        Players get their game back by joining under the same name.
+        Raises ValueError if a game with the same id already exists.
+        """
+        with self._lock:
+            for game in games:
+                game_state = self._NewGame(game.game_id)
+                game_state.Restore(game)
+                for player_name, color in game.players:
+                    self._rejoining.setdefault(player_name, []).append(
+                        game_state)
+
+
+def _IsEntryMove(board, msg):
+    """True if msg pushes in from an entry dot in one of its directions."""
+    try:
+        directions = board.PossibleDirections(msg.letter, msg.number)
+    except KeyError:
+        return False
+    return msg.direction in directions
+
+
+class PlayerSession(object):
+    """One player's seat in one game, on a connection that may hold many.
+
+    session_id is None for the plain game of a connection that does not
+    wrap its messages in messages.Session.
+    """
+
+    def __init__(self, handler, session_id, player_name):
+        self._handler = handler
+        self.session_id = session_id
+        self.player_name = player_name
+        self.game_state = None
+        self.color = None
+
+    def Send(self, msg):
+        self._handler.Send(msg, self.session_id)
+
+    def GameStarted(self, game_state, color):
+        """The game filled up and this player plays color."""
+        self.color = color
+        start_msg = messages.StartGame()
+        start_msg.color = color
+        self.Send(start_msg)
+        if game_state.restored:
+            sync_msg = messages.SyncBoard()
+            with game_state.board_lock:
+                sync_msg.to_move = game_state.to_move
+                sync_msg.board = game_state.board.Pack()
+            self.Send(sync_msg)
+
+    def GameFinished(self):
+        """The game is over, so stop routing messages to it."""
+        if self.session_id is not None:
+            self._handler.EndSession(self.session_id)
+
+    def Stop(self):
+        """Drop this player, ending the connection for a plain game."""
+        if self.session_id is None:
+            self._handler.Stop()
+        else:
+            self._handler.EndSession(self.session_id)
+
+
 class GIPFHandler(threading.Thread):
+    """Serves one client connection, carrying any number of games.
+
+    Messages wrapped in messages.Session are routed to the game session
+    with that id, and unwrapped ones to the connection's plain game.
+    Replies are queued while a batch of received messages is handled and
+    go out together in one send at the end of it.  on_batch(count), if
+    given, is called after each batch of count messages has been handled
+    and its replies sent.
+    """
 
-    def __init__(self, socket, game_state):
+    def __init__(self, socket, lobby, connection_id=0, trace=None,
+                 on_batch=None):
         super(GIPFHandler, self).__init__()
         self._socket = socket
-        self._game_state = game_state
+        self._lobby = lobby
+        self._connection_id = connection_id
+        self._trace = trace
+        self._on_batch = on_batch
         self._msg_handlers = {messages.JoinGame: self._JoinGame,
                               messages.TryMove: self._TryMove,
                               messages.QuitGame: self._QuitGame,
                               messages.Shutdown: self._Shutdown}
         self._done = False
+        self._closed = False
+        # Game sessions by id.  Games started or finished by other
+        # threads end sessions too, so changes take _sessions_lock.
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._outbox = []
+        self._batching = False
 
     def __del__(self):
         # TODO(piotrf): send a quitting message here
         self._socket.close()
 
-    def _JoinGame(self, msg):
-        self._player_name = msg.player_name
-        print self._player_name, 'joined!'
-        if not self._game_state.AddPlayer(self._player_name, self):
-            self._socket.send('GF')
-            self._done = True
+    def _JoinGame(self, msg, session_id):
+        with self._sessions_lock:
+            if session_id in self._sessions:
+                print 'ERROR - session', session_id, 'already joined'
+                return
+            session = PlayerSession(self, session_id, msg.player_name)
+            self._sessions[session_id] = session
+        print msg.player_name, 'joined!'
+        session.game_state, filled = self._lobby.Join(msg.player_name,
+                                                      session)
+        if filled:
+            session.game_state.AnnounceStart()
+
+    def _TryMove(self, msg, session_id):
+        session = self._sessions.get(session_id)
+        if session is None or session.game_state is None:
+            print 'ERROR - move for unknown session', session_id
             return
-        self._color = self._game_state.WaitForGameStart(self._player_name)
-        start_msg = messages.StartGame()
-        start_msg.color = self._color
-        self._socket.send(start_msg.Pack())
-
-    def _TryMove(self, msg):
-        with self._game_state.board_lock:
-            if self._game_state.board.Move(msg.letter,
-                                           msg.number,
-                                           msg.direction,
-                                           self._color):
-                self._game_state.board.Resolve(self._color)
-                winner = self._game_state.board.CheckForWinner()
+        game_state = session.game_state
+        with game_state.board_lock:
+            if game_state.finished:
+                return
+            if session.color != game_state.to_move:
+                print session.player_name, 'moved out of turn'
+                return
+            if not _IsEntryMove(game_state.board, msg):
+                print session.player_name, 'sent a malformed move'
+                return
+            if game_state.board.Move(msg.letter,
+                                     msg.number,
+                                     msg.direction,
+                                     session.color):
+                game_state.board.Resolve(session.color)
+                game_state.moves.append((msg.letter,
+                                         msg.number,
+                                         msg.direction))
+                winner = game_state.board.CheckForWinner()
                 if winner:
-                    win_msg = messages.DeclareWinner()
-                    win_msg.winner = winner
-                    self._game_state.Broadcast(win_msg)
-                    self._done = True
+                    game_state.Finish(winner)
+                    if session_id is None:
+                        self._done = True
                 else:
+                    game_state.EndTurn(session.color)
                     move_msg = messages.MakeMove()
                     move_msg.letter = msg.letter
                     move_msg.number = msg.number
                     move_msg.direction = msg.direction
-                    move_msg.color = self._color
-                    self._game_state.Broadcast(move_msg)
+                    move_msg.color = session.color
+                    game_state.Broadcast(move_msg)
             else:
-                print self._player_name, 'made an invalid move'
+                print session.player_name, 'made an invalid move'
+
+    def _QuitGame(self, msg, session_id):
+        session = self.EndSession(session_id)
+        if session:
+            print session.player_name, 'quit'
+            self._Leave(session)
+        if session_id is None:
+            self._done = True
 
-    def _QuitGame(self, msg):
-        print self._player_name, 'quit'
+    def _Shutdown(self, msg, session_id):
+        print 'Connection with', len(self._sessions), 'sessions quit abruptly!'
         self._done = True
 
-    def _Shutdown(self, msg):
-        print self._player_name, 'quit abruptly!'
+    def _Leave(self, session):
+        if session.game_state is not None:
+            self._lobby.Leave(session.game_state, session)
+
+    def _LeaveAll(self):
+        """The connection is gone: leave every game still open on it."""
+        with self._sessions_lock:
+            sessions = self._sessions.values()
+            self._sessions = {}
+        for session in sessions:
+            self._Leave(session)
+
+    def _Close(self):
+        """Leave the games of the connection once it is done.
+
+        Call with the trace lock held, if tracing, so that replays close
+        the connection at the same point.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._trace:
+            self._trace.LogClose(self._connection_id)
+        self._LeaveAll()
+
+    def EndSession(self, session_id):
+        """Stop routing messages to a session, returning it if it was open."""
+        with self._sessions_lock:
+            return self._sessions.pop(session_id, None)
+
+    def Send(self, msg, session_id=None):
+        """Queue msg for the client, sending it now unless in a batch."""
+        if session_id is not None:
+            msg = messages.Session(session_id, msg)
+        with self._send_lock:
+            self._outbox.append(msg)
+            if not self._batching:
+                self._FlushLocked()
+
+    def _FlushLocked(self):
+        if not self._outbox:
+            return
+        data = messages.PackAll(self._outbox)
+        self._outbox = []
+        try:
+            self._socket.sendall(data)
+        except socket.error:
+            # The receive loop notices the connection is gone.
+            pass
+
+    def Stop(self):
+        """End this connection, waking the handler thread if it is blocked."""
         self._done = True
+        with self._send_lock:
+            self._FlushLocked()
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
 
-    def Send(self, msg):
-        self._socket.send(msg.Pack())
+    def _HandleBatch(self, msgs):
+        """Handle msgs, sending all their replies in one go."""
+        with self._send_lock:
+            self._batching = True
+        try:
+            for msg in msgs:
+                if self._trace:
+                    with self._trace.lock:
+                        self._trace.Log(self._connection_id, msg)
+                        self._HandleMessage(msg)
+                        if self._done:
+                            self._Close()
+                else:
+                    self._HandleMessage(msg)
+                    if self._done:
+                        self._Close()
+                if self._done:
+                    break
+        finally:
+            with self._send_lock:
+                self._batching = False
+                self._FlushLocked()
+        if self._on_batch:
+            self._on_batch(len(msgs))
+
+    def _HandleMessage(self, msg):
+        session_id = None
+        if isinstance(msg, messages.Session):
+            session_id = msg.session_id
+            msg = msg.msg
+        handler = self._msg_handlers.get(msg.__class__)
+        if handler is None:
+            print 'ERROR - unexpected message', msg.CMD, 'for session', \
+                session_id
+            return
+        # One session's bad message must not take down the other games
+        # on this connection.
+        try:
+            handler(msg, session_id)
+        except Exception, e:
+            print 'ERROR - failed to handle', msg.CMD, 'for session', \
+                session_id, '-', e
 
     def run(self):
+        try:
+            self._Serve()
+        finally:
+            if self._trace:
+                with self._trace.lock:
+                    self._Close()
+            else:
+                self._Close()
+
+    def _Serve(self):
+        pending = ''
         while not self._done:
-            data = self._socket.recv(1024).strip()
             try:
-                msg = messages.Unpack(data)
-                self._msg_handlers[msg.__class__](msg)
-            except ValueError, KeyError:
-                print 'ERROR - invalid message:', data
+                data = self._socket.recv(65536)
+            except socket.error:
+                data = ''
+            if not data:
+                self._done = True
+                break
+            pending += data
+            try:
+                msgs, consumed = messages.UnpackAll(pending)
+                pending = pending[consumed:]
+                self._HandleBatch(msgs)
+            except (ValueError, KeyError):
+                print 'ERROR - invalid message:', repr(pending)
                 self._done = True
 
 class GIPFServer(object):
 
-    def __init__(self):
+    def __init__(self, record_path=None, time_control=None,
+                 snapshot_path=None, snapshot_interval=30.0, seed=None,
+                 trace=None):
         self.HOST = 'localhost'
         self.PORT = 2222
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._game_state = GameState()
+        self._lobby = GameLobby(record_path, time_control, seed)
+        self._connection_ids = itertools.count()
+        self._trace = trace
+        self.snapshot_writer = None
+        if snapshot_path:
+            if os.path.exists(snapshot_path):
+                games = snapshot.Read(snapshot_path)
+                self._lobby.Restore(games)
+                print 'Restored', len(games), 'games from', snapshot_path
+            self.snapshot_writer = snapshot.SnapshotWriter(
+                snapshot_path, snapshot_interval, self._lobby.Snapshot)
 
     def __del__(self):
         self._socket.close()
 
     def Serve(self):
+        if self.snapshot_writer:
+            self.snapshot_writer.start()
+        # Let a restarted server take the port straight back.
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._socket.bind((self.HOST, self.PORT))
         self._socket.listen(1)
         while True:
-            conn, addr = self._socket.accept()
-            handler = GIPFHandler(conn, self._game_state)
-            handler.daemon = True
-            handler.start()
+            try:
+                conn, addr = self._socket.accept()
+            except socket.error, e:
+                # Signals such as the snapshot request interrupt accept.
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            self.AddConnection(conn)
+
+    def AddConnection(self, conn, on_batch=None):
+        """Serve a connected socket, e.g. one end of a socketpair."""
+        handler = GIPFHandler(conn, self._lobby, next(self._connection_ids),
+                              self._trace, on_batch)
+        handler.daemon = True
+        handler.start()
+        return handler
 
 if __name__=="__main__":
-    server = GIPFServer()
-    server.Serve()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write gipf.Board stats to FILE on exit')
+    parser.add_argument('--record', metavar='FILE',
+                        help='append finished games to FILE for analysis')
+    parser.add_argument('--clock', metavar='BASE+INC',
+                        type=clock.ParseTimeControl,
+                        help='time control in seconds, e.g. 300+5')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='restore games from FILE at startup and save '
+                        'them there periodically, on SIGUSR1 and on exit')
+    parser.add_argument('--snapshot-interval', metavar='SECONDS',
+                        type=float, default=30.0)
+    parser.add_argument('--seed', type=int,
+                        help='seed the color assignment of every game')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write the messages clients send to FILE for '
+                        'trace_replay.py; serializes message handling')
+    args = parser.parse_args()
+    if args.profile:
+        profiler.Enable()
+    trace = None
+    if args.trace:
+        if args.seed is None:
+            # Replays need the seed the colors came from.
+            args.seed = random.getrandbits(31)
+            print 'Tracing with seed', args.seed
+        trace = traces.TraceWriter(args.trace, args.seed)
+
+    server = GIPFServer(args.record, args.clock,
+                        args.snapshot, args.snapshot_interval,
+                        args.seed, trace)
+    if server.snapshot_writer:
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: server.snapshot_writer.Request())
+    if server.snapshot_writer or trace:
+        signal.signal(signal.SIGTERM,
+                      lambda signum, frame: sys.exit(0))
+    try:
+        server.Serve()
+    finally:
+        if server.snapshot_writer:
+            print 'Saved', server.snapshot_writer.WriteNow(), 'games'
+        if args.profile:
+            profiler.Dump(profiler.Stats(), args.profile)
+        if trace:
+            trace.Close()
@@ -1,122 +1,347 @@
+"""
+Wire messages between the GIPF client and server.
+
+Every message starts with a 2 byte command followed by a fixed layout
+body, except JoinGame whose body is a length prefixed player name.  A
+connection can carry many games at once by wrapping messages in a Session
+envelope, which tags them with the id of the game session they belong to;
+unwrapped messages belong to the connection's one plain game.
+Encoding and decoding go through precompiled struct.Struct instances and
+work in place on any buffer (str, bytearray or memoryview), so a receive
+buffer holding many messages can be decoded with UnpackAll without
+slicing it up first.
+"""
+
 import struct
 
-def Unpack(data):
-    cmd = data[0:2]
-    if cmd == 'JG':
-        msg = JoinGame()
-    elif cmd == 'TM':
-        msg = TryMove()
-    elif cmd == 'QG':
-        msg = QuitGame()
-    elif cmd == 'SD':
-        msg = Shutdown()
-    elif cmd == 'SG':
-        msg = StartGame()
-    elif cmd == 'MM':
-        msg = MakeMove()
-    elif cmd == 'DW':
-        msg = DeclareWinner()
-    else:
-        raise ValueError
-    msg.Unpack(data[2:])
+import gipf
+
+# Commands are read as a little endian short so dispatch never copies.
+_COMMAND = struct.Struct('<H')
+
+
+def _CommandKey(cmd):
+    return _COMMAND.unpack(cmd)[0]
+
+
+def Unpack(data, offset=0):
+    """Decode the single message starting at offset in data."""
+    try:
+        msg = _Decode(data, offset)[0]
+    except struct.error:
+        raise ValueError('truncated message')
     return msg
 
+
+def UnpackAll(data):
+    """Decode every complete message in data.
+
+    Returns a (messages, consumed) pair, where consumed is the number of
+    bytes used.  A partial message at the end of data is left for the
+    caller to complete with the next read.
+    """
+    msgs = []
+    offset = 0
+    end = len(data)
+    while offset + _COMMAND.size <= end:
+        try:
+            msg, offset_after = _Decode(data, offset)
+        except struct.error:
+            break
+        msgs.append(msg)
+        offset = offset_after
+    return msgs, offset
+
+
+def PackAll(msgs):
+    """Encode several messages into one string, e.g. for a single send."""
+    buf = bytearray(sum(msg.Size() for msg in msgs))
+    offset = 0
+    for msg in msgs:
+        offset = msg.PackInto(buf, offset)
+    return str(buf)
+
+
+def _Decode(data, offset):
+    try:
+        cls = _DISPATCH[_COMMAND.unpack_from(data, offset)[0]]
+    except KeyError:
+        raise ValueError('unknown message command')
+    msg = cls.__new__(cls)
+    return msg, msg.Decode(data, offset)
+
 # Client -> Server messages
 
+_JOIN_GAME = struct.Struct('<2sB')
+_JOIN_GAME_BODY = struct.Struct('<2xB')
+
 class JoinGame(object):
+    __slots__ = ('player_name',)
+    CMD = 'JG'
+
     def __init__(self):
         self.player_name = ''
 
+    def Size(self):
+        return _JOIN_GAME.size + len(self.player_name)
+
     def Pack(self):
-        cmd = 'JG'
-        data = self.player_name
-        return cmd + data
+        if len(self.player_name) > 255:
+            raise ValueError('player name too long')
+        return (_JOIN_GAME.pack(self.CMD, len(self.player_name)) +
+                self.player_name)
 
-    def Unpack(self, data):
-        self.player_name = data
+    def PackInto(self, buf, offset):
+        if len(self.player_name) > 255:
+            raise ValueError('player name too long')
+        _JOIN_GAME.pack_into(buf, offset, self.CMD, len(self.player_name))
+        start = offset + _JOIN_GAME.size
+        end = start + len(self.player_name)
+        buf[start:end] = self.player_name
+        return end
 
+    def Decode(self, data, offset):
+        (length,) = _JOIN_GAME_BODY.unpack_from(data, offset)
+        start = offset + _JOIN_GAME.size
+        end = start + length
+        if end > len(data):
+            raise struct.error('truncated player name')
+        name = data[start:end]
+        if isinstance(name, memoryview):
+            name = name.tobytes()
+        self.player_name = str(name)
+        return end
+
+
+_TRY_MOVE = struct.Struct('<2sbbb')
+_TRY_MOVE_BODY = struct.Struct('<2xbbb')
 
 class TryMove(object):
+    __slots__ = ('letter', 'number', 'direction')
+    CMD = 'TM'
+
     def __init__(self):
         self.letter = 0
         self.number = 0
         self.direction = 0
 
+    def Size(self):
+        return _TRY_MOVE.size
+
     def Pack(self):
-        cmd = 'TM'
-        data = struct.pack('bbb', 
-                           self.letter, 
-                           self.number, 
-                           self.direction)
-        return cmd + data
-    
-    def Unpack(self, data):
-        (self.letter, 
-         self.number, 
-         self.direction) = struct.unpack('bbb', data)
+        return _TRY_MOVE.pack(self.CMD,
+                              self.letter,
+                              self.number,
+                              self.direction)
+
+    def PackInto(self, buf, offset):
+        _TRY_MOVE.pack_into(buf, offset, self.CMD,
+                            self.letter,
+                            self.number,
+                            self.direction)
+        return offset + _TRY_MOVE.size
+
+    def Decode(self, data, offset):
+        (self.letter,
+         self.number,
+         self.direction) = _TRY_MOVE_BODY.unpack_from(data, offset)
+        return offset + _TRY_MOVE.size
 
 
 class QuitGame(object):
+    __slots__ = ()
+    CMD = 'QG'
+
+    def Size(self):
+        return 2
+
     def Pack(self):
-        cmd = 'QG'
-        return cmd
+        return self.CMD
+
+    def PackInto(self, buf, offset):
+        buf[offset:offset + 2] = self.CMD
+        return offset + 2
 
-    def Unpack(self, data):
-        pass
+    def Decode(self, data, offset):
+        return offset + 2
 
 
 class Shutdown(object):
+    __slots__ = ()
+    CMD = 'SD'
+
+    def Size(self):
+        return 2
+
     def Pack(self):
-        cmd = 'SD'
-        return cmd
-        
-    def Unpack(self, data):
-        pass
+        return self.CMD
+
+    def PackInto(self, buf, offset):
+        buf[offset:offset + 2] = self.CMD
+        return offset + 2
+
+    def Decode(self, data, offset):
+        return offset + 2
 
 # Server -> Client messages
 
+_START_GAME = struct.Struct('<2sb')
+_START_GAME_BODY = struct.Struct('<2xb')
+
 class StartGame(object):
+    __slots__ = ('color',)
+    CMD = 'SG'
+
     def __init__(self):
         self.color = 0
-        
+
+    def Size(self):
+        return _START_GAME.size
+
     def Pack(self):
-        cmd = 'SG'
-        data = struct.pack('b', self.color)
-        return cmd + data
+        return _START_GAME.pack(self.CMD, self.color)
 
-    def Unpack(self, data):
-        (self.color,) = struct.unpack('b', data)
+    def PackInto(self, buf, offset):
+        _START_GAME.pack_into(buf, offset, self.CMD, self.color)
+        return offset + _START_GAME.size
+
+    def Decode(self, data, offset):
+        (self.color,) = _START_GAME_BODY.unpack_from(data, offset)
+        return offset + _START_GAME.size
+
+
+_MAKE_MOVE = struct.Struct('<2sbbbb')
+_MAKE_MOVE_BODY = struct.Struct('<2xbbbb')
 
 class MakeMove(object):
+    __slots__ = ('letter', 'number', 'direction', 'color')
+    CMD = 'MM'
+
     def __init__(self):
         self.letter = 0
         self.number = 0
         self.direction = 0
         self.color = 0
 
+    def Size(self):
+        return _MAKE_MOVE.size
+
     def Pack(self):
-        cmd = 'MM'
-        data = struct.pack('bbbb', 
-                           self.letter, 
-                           self.number, 
-                           self.direction,
-                           self.color)
-        return cmd + data
-    
-    def Unpack(self, data):
-        (self.letter, 
-         self.number, 
+        return _MAKE_MOVE.pack(self.CMD,
+                               self.letter,
+                               self.number,
+                               self.direction,
+                               self.color)
+
+    def PackInto(self, buf, offset):
+        _MAKE_MOVE.pack_into(buf, offset, self.CMD,
+                             self.letter,
+                             self.number,
+                             self.direction,
+                             self.color)
+        return offset + _MAKE_MOVE.size
+
+    def Decode(self, data, offset):
+        (self.letter,
+         self.number,
          self.direction,
-         self.color) = struct.unpack('bbbb', data)
+         self.color) = _MAKE_MOVE_BODY.unpack_from(data, offset)
+        return offset + _MAKE_MOVE.size
+
+
+_DECLARE_WINNER = struct.Struct('<2sb')
+_DECLARE_WINNER_BODY = struct.Struct('<2xb')
 
 class DeclareWinner(object):
+    __slots__ = ('winner',)
+    CMD = 'DW'
+
     def __init__(self):
         self.winner = 0
 
+    def Size(self):
+        return _DECLARE_WINNER.size
+
+    def Pack(self):
+        return _DECLARE_WINNER.pack(self.CMD, self.winner)
+
+    def PackInto(self, buf, offset):
+        _DECLARE_WINNER.pack_into(buf, offset, self.CMD, self.winner)
+        return offset + _DECLARE_WINNER.size
+
+    def Decode(self, data, offset):
+        (self.winner,) = _DECLARE_WINNER_BODY.unpack_from(data, offset)
+        return offset + _DECLARE_WINNER.size
+
+
+_SYNC_BOARD = struct.Struct('<2sb%ds' % len(gipf.Board().Pack()))
+_SYNC_BOARD_BODY = struct.Struct('<2xb%ds' % len(gipf.Board().Pack()))
+
+class SyncBoard(object):
+    """Position of a game the player rejoined, sent after StartGame."""
+    __slots__ = ('to_move', 'board')
+    CMD = 'SB'
+
+    def __init__(self):
+        self.to_move = 0
+        # Board.Pack() snapshot.
+        self.board = gipf.Board().Pack()
+
+    def Size(self):
+        return _SYNC_BOARD.size
+
     def Pack(self):
-        cmd = 'DW'
-        data = struct.pack('b', self.winner)
-        return cmd + data
+        return _SYNC_BOARD.pack(self.CMD, self.to_move, self.board)
+
+    def PackInto(self, buf, offset):
+        _SYNC_BOARD.pack_into(buf, offset, self.CMD, self.to_move, self.board)
+        return offset + _SYNC_BOARD.size
+
+    def Decode(self, data, offset):
+        (self.to_move,
+         self.board) = _SYNC_BOARD_BODY.unpack_from(data, offset)
+        return offset + _SYNC_BOARD.size
+
+
+# Both directions
+
+_SESSION = struct.Struct('<2sI')
+_SESSION_BODY = struct.Struct('<2xI')
+
+class Session(object):
+    """Envelope routing msg to the game session session_id."""
+    __slots__ = ('session_id', 'msg')
+    CMD = 'SS'
+
+    def __init__(self, session_id=0, msg=None):
+        self.session_id = session_id
+        self.msg = msg
+
+    def Size(self):
+        return _SESSION.size + self.msg.Size()
+
+    def Pack(self):
+        return _SESSION.pack(self.CMD, self.session_id) + self.msg.Pack()
+
+    def PackInto(self, buf, offset):
+        _SESSION.pack_into(buf, offset, self.CMD, self.session_id)
+        return self.msg.PackInto(buf, offset + _SESSION.size)
+
+    def Decode(self, data, offset):
+        (self.session_id,) = _SESSION_BODY.unpack_from(data, offset)
+        self.msg, end = _Decode(data, offset + _SESSION.size)
+        if isinstance(self.msg, Session):
+            raise ValueError('nested session message')
+        return end
+
 
-    def Unpack(self, data):
-        (self.winner,) = struct.unpack('b', data)
+# Dispatch table from command to message class.
+_DISPATCH = dict((_CommandKey(cls.CMD), cls) for cls in (JoinGame,
+                                                         TryMove,
+                                                         QuitGame,
+                                                         Shutdown,
+                                                         StartGame,
+                                                         MakeMove,
+                                                         DeclareWinner,
+                                                         SyncBoard,
+                                                         Session))
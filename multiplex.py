@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Many games over one server connection, for automated players.
+
+Each game is a session with an id chosen by the client.  Messages for it
+are wrapped in messages.Session both ways, so a single socket and a
+single server thread carry every game a bot farm plays.  Outgoing
+messages are queued and sent together by Flush, and Receive hands back
+every message that arrived in one read.
+
+Run as a script it is a bot farm: --games games between pairs of
+players, every seat on one connection, playing until all are decided:
+
+    multiplex.py --games 200 --player random
+"""
+
+import argparse
+import itertools
+import random
+import socket
+import sys
+import time
+
+import gipf
+import messages
+import tournament
+
+
+class MultiplexConnection(object):
+    """A client connection carrying many game sessions."""
+
+    def __init__(self, host='localhost', port=2222):
+        self._socket = socket.create_connection((host, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._session_ids = itertools.count(1)
+        self._outbox = []
+        self._pending = ''
+
+    def Join(self, player_name):
+        """Queue a JoinGame in a new session and return its id."""
+        session_id = next(self._session_ids)
+        msg = messages.JoinGame()
+        msg.player_name = player_name
+        self.Send(session_id, msg)
+        return session_id
+
+    def Send(self, session_id, msg):
+        """Queue msg for session_id until the next Flush."""
+        self._outbox.append(messages.Session(session_id, msg))
+
+    def Flush(self):
+        """Send every queued message at once."""
+        if self._outbox:
+            self._socket.sendall(messages.PackAll(self._outbox))
+            self._outbox = []
+
+    def Receive(self):
+        """Block until messages arrive, return them as (session_id, msg).
+
+        Messages outside any session come back with session_id None.
+        """
+        self.Flush()
+        while True:
+            data = self._socket.recv(65536)
+            if not data:
+                raise socket.error('server closed the connection')
+            self._pending += data
+            msgs, consumed = messages.UnpackAll(self._pending)
+            self._pending = self._pending[consumed:]
+            if msgs:
+                return [(msg.session_id, msg.msg)
+                        if isinstance(msg, messages.Session) else (None, msg)
+                        for msg in msgs]
+
+    def Close(self):
+        self.Flush()
+        self._socket.sendall(messages.Shutdown().Pack())
+        self._socket.close()
+
+
+class _Seat(object):
+    """Client side view of one session of the bot farm."""
+
+    def __init__(self, player):
+        self.player = player
+        self.board = gipf.Board()
+        self.color = None
+        self.to_move = gipf.Board.WHITE
+        self.winner = None
+
+
+def _TryMove(conn, session_id, seat):
+    """Queue seat's move, or quit the game if it has none."""
+    if not seat.board.LegalMoves():
+        conn.Send(session_id, messages.QuitGame())
+        seat.winner = 0
+        return
+    letter, number, direction = seat.player.ChooseMove(seat.board,
+                                                       seat.color)
+    msg = messages.TryMove()
+    msg.letter = letter
+    msg.number = number
+    msg.direction = direction
+    conn.Send(session_id, msg)
+
+
+def RunFarm(host, port, games, player_spec, seed=0):
+    """Play games games over one connection, return (games, moves, secs)."""
+    rng = random.Random(seed)
+    conn = MultiplexConnection(host, port)
+    seats = {}
+    for k in range(2 * games):
+        seat = _Seat(tournament.MakePlayer(player_spec, rng))
+        seats[conn.Join('bot%d-%d' % (seed, k))] = seat
+    start = time.time()
+    moves = 0
+    playing = len(seats)
+    while playing:
+        for session_id, msg in conn.Receive():
+            seat = seats.get(session_id)
+            if seat is None or seat.winner is not None:
+                continue
+            if isinstance(msg, messages.StartGame):
+                seat.color = msg.color
+            elif isinstance(msg, messages.SyncBoard):
+                seat.board.Unpack(msg.board)
+                seat.to_move = msg.to_move
+            elif isinstance(msg, messages.MakeMove):
+                seat.board.Move(msg.letter, msg.number, msg.direction,
+                                msg.color)
+                seat.board.Resolve(msg.color)
+                seat.to_move = seat.board.NextColor(msg.color)
+                if msg.color == seat.color:
+                    moves += 1
+            elif isinstance(msg, messages.DeclareWinner):
+                seat.winner = msg.winner
+            if seat.winner is not None:
+                playing -= 1
+            elif seat.color == seat.to_move and \
+                    isinstance(msg, (messages.StartGame, messages.SyncBoard,
+                                     messages.MakeMove)):
+                _TryMove(conn, session_id, seat)
+                if seat.winner is not None:
+                    playing -= 1
+    elapsed = time.time() - start
+    conn.Close()
+    return games, moves, elapsed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--games', type=int, default=100,
+                        help='games to play, two seats each')
+    parser.add_argument('--player', default='random',
+                        help='player spec, as for tournament.py')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    games, moves, elapsed = RunFarm(args.host, args.port, args.games,
+                                    args.player, args.seed)
+    print 'Played %d games, %d moves in %.1fs (%.0f moves/s)' % (
+        games, moves, elapsed, moves / max(elapsed, 1e-9))
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Perft: count the leaf positions reachable from the initial board.
+
+A move is any (letter, number, direction) allowed by PossibleDirections
+and CanMove, followed by Move and Resolve for the player to move.  White
+moves first and players alternate.  Positions with a winner are not
+expanded further.
+
+No row is ever completed within the GOLDEN depths from the initial
+board, so those only pin down move generation.  Resolution is pinned by
+POSITIONS, crowded positions from random games whose moves complete
+several rows at once, rows that cross, rows of the opponent and rows
+extended by the opponent's pieces.  Their counts are kept both for plain
+perft and for perft that branches on every CaptureOptions choice, along
+with the options of every capturing move.  Together they let a faster
+gipf.Board be checked for exact equivalence and timed on the same work:
+
+    perft.py 3          count and time depth 3
+    perft.py --check    verify every golden depth up to --max-depth
+"""
+
+import argparse
+import sys
+import time
+
+import gipf
+import profiler
+
+# Leaf counts from the initial Board() with white to move.
+GOLDEN = {
+    0: 1,
+    1: 42,
+    2: 1764,
+    3: 73800,
+    4: 3066768,
+}
+
+# name: (Board.Pack() as hex, color to move, {depth: leaves},
+#        {depth: leaves when branching on capture options}).
+POSITIONS = {
+    'all_rows': (
+        '0304000000000000020202010000010000010200000201010100020000010000'
+        '00010202000001000000020100000202020001000001010201000000000000',
+        gipf.Board.WHITE,
+        {1: 30, 2: 920, 3: 28564},
+        {1: 32, 2: 1064, 3: 34267}),
+    'four_options': (
+        '0101000000000000010201010000000102010000000202010102020000020101'
+        '00020202000002020201020100000001000102000001010102000000000000',
+        gipf.Board.WHITE,
+        {1: 22, 2: 174, 3: 1510},
+        {1: 28, 2: 398, 3: 5763}),
+    'black_crossing': (
+        '0401000000000000020202010000020201020100000101020201010000000202'
+        '01010202000000020100000100000002020201000000010201000000000000',
+        gipf.Board.BLACK,
+        {1: 26, 2: 406, 3: 13522},
+        {1: 30, 2: 549, 3: 18556}),
+}
+
+# CaptureOptions after every move of a POSITIONS entry that captures.
+OPTIONS = {
+    'all_rows': {
+        (0, 2, 2): [
+            ((21, 0, 6, 1),),
+        ],
+        (0, 4, 3): [
+            ((13, 0, 4, 1),),
+        ],
+        (2, 0, 2): [
+            ((21, 0, 4, 1),),
+        ],
+        (2, 6, 3): [
+            ((15, 0, 5, 2),),
+            ((24, 0, 5, 2),),
+        ],
+        (4, 8, 4): [
+            ((13, 0, 4, 1), (16, 0, 4, 1)),
+        ],
+        (5, 7, 4): [
+            ((5, 2, 6, 1),),
+        ],
+        (6, 0, 1): [
+            ((1, 0, 4, 1), (15, 0, 5, 2)),
+        ],
+        (7, 0, 6): [
+            ((1, 0, 4, 1),),
+        ],
+        (8, 2, 6): [
+            ((25, 0, 4, 1), (15, 0, 4, 2)),
+            ((25, 0, 4, 1), (24, 0, 5, 2)),
+        ],
+        (8, 3, 5): [
+            ((25, 0, 4, 1),),
+        ],
+    },
+    'black_crossing': {
+        (0, 0, 2): [
+            ((4, 0, 7, 2),),
+        ],
+        (0, 1, 2): [
+            ((12, 0, 5, 2),),
+            ((20, 0, 5, 2),),
+        ],
+        (0, 1, 3): [
+            ((2, 0, 5, 2),),
+        ],
+        (0, 3, 3): [
+            ((20, 0, 5, 2), (24, 0, 5, 2)),
+        ],
+        (0, 4, 3): [
+            ((4, 0, 4, 2),),
+            ((19, 0, 4, 2),),
+        ],
+        (6, 0, 1): [
+            ((12, 0, 6, 2),),
+            ((24, 0, 5, 2),),
+        ],
+        (6, 6, 4): [
+            ((12, 0, 6, 2),),
+        ],
+        (7, 0, 6): [
+            ((12, 0, 6, 2),),
+            ((24, 0, 5, 2),),
+        ],
+        (7, 5, 4): [
+            ((2, 0, 5, 2),),
+        ],
+        (7, 5, 5): [
+            ((24, 1, 5, 2),),
+        ],
+        (8, 1, 6): [
+            ((2, 0, 5, 2),),
+        ],
+        (8, 2, 6): [
+            ((15, 0, 5, 2),),
+        ],
+    },
+    'four_options': {
+        (0, 0, 2): [
+            ((4, 0, 7, 1),),
+            ((13, 0, 7, 1),),
+        ],
+        (0, 3, 3): [
+            ((2, 0, 5, 1),),
+        ],
+        (0, 4, 3): [
+            ((4, 0, 7, 1),),
+            ((13, 0, 7, 1),),
+        ],
+        (4, 0, 1): [
+            ((4, 0, 7, 1),),
+            ((13, 0, 7, 1),),
+        ],
+        (6, 6, 4): [
+            ((15, 0, 5, 2),),
+        ],
+        (8, 0, 6): [
+            ((22, 0, 7, 2),),
+        ],
+        (8, 4, 5): [
+            ((4, 0, 7, 1),),
+            ((13, 0, 7, 1), (15, 0, 5, 2)),
+            ((25, 0, 4, 1), (4, 0, 6, 1)),
+            ((25, 0, 4, 1), (13, 0, 6, 1), (15, 0, 4, 2)),
+        ],
+    },
+}
+
+
+def Perft(board, color, depth, options=False):
+    """Number of leaf positions depth plies below board, color to move.
+
+    With options, a move whose captures can be resolved in several ways
+    has one child per CaptureOptions choice instead of just the first.
+    """
+    if depth == 0:
+        return 1
+    nodes = 0
+    next_color = board.NextColor(color)
+    for letter, number, direction in board.LegalMoves():
+        child = board.Copy()
+        child.Move(letter, number, direction, color)
+        if options:
+            children = []
+            for option in child.CaptureOptions(color):
+                choice = child.Copy()
+                choice.Resolve(color, option)
+                children.append(choice)
+        else:
+            child.Resolve(color)
+            children = [child]
+        for child in children:
+            if depth == 1:
+                nodes += 1
+            elif child.CheckForWinner():
+                continue
+            else:
+                nodes += Perft(child, next_color, depth - 1, options)
+    return nodes
+
+
+def PositionBoard(name):
+    """The board and color to move of POSITIONS[name]."""
+    packed, color = POSITIONS[name][:2]
+    board = gipf.Board()
+    board.Unpack(packed.decode('hex'))
+    return board, color
+
+
+def CaptureListing(board, color):
+    """{move: CaptureOptions} for every move of color that captures."""
+    listing = {}
+    for move in board.LegalMoves():
+        child = board.Copy()
+        child.Move(move[0], move[1], move[2], color)
+        options = child.CaptureOptions(color)
+        if options != [()]:
+            listing[move] = options
+    return listing
+
+
+def Divide(board, color, depth):
+    """Perft split by root move, as a list of (move, nodes) pairs."""
+    result = []
+    for move in board.LegalMoves():
+        child = board.Copy()
+        child.Move(move[0], move[1], move[2], color)
+        child.Resolve(color)
+        if depth > 1 and child.CheckForWinner():
+            nodes = 0
+        else:
+            nodes = Perft(child, board.NextColor(color), depth - 1)
+        result.append((move, nodes))
+    return result
+
+
+def TimedPerft(depth):
+    """Run perft from the initial board, returning (nodes, seconds)."""
+    start = time.time()
+    nodes = Perft(gipf.Board(), gipf.Board.WHITE, depth)
+    return nodes, time.time() - start
+
+
+def _Report(label, nodes, expected):
+    print '%s: %d nodes (expected %d) %s' % (
+        label, nodes, expected, 'ok' if nodes == expected else 'FAIL')
+    return nodes == expected
+
+
+def Check(max_depth):
+    """Compare perft against GOLDEN, POSITIONS and OPTIONS up to max_depth.
+
+    Returns True if everything matches.
+    """
+    ok = True
+    for depth in sorted(GOLDEN):
+        if depth > max_depth:
+            break
+        nodes, elapsed = TimedPerft(depth)
+        ok &= _Report('depth %d' % depth, nodes, GOLDEN[depth])
+    for name in sorted(POSITIONS):
+        board, color = PositionBoard(name)
+        plain, branching = POSITIONS[name][2:]
+        for depth in sorted(plain):
+            if depth <= max_depth:
+                ok &= _Report('%s depth %d' % (name, depth),
+                              Perft(board, color, depth), plain[depth])
+        for depth in sorted(branching):
+            if depth <= max_depth:
+                ok &= _Report('%s depth %d with options' % (name, depth),
+                              Perft(board, color, depth, True),
+                              branching[depth])
+        listing = CaptureListing(board, color)
+        matches = listing == OPTIONS[name]
+        print '%s: capture options of %d moves %s' % (
+            name, len(listing), 'ok' if matches else 'FAIL')
+        ok &= matches
+    return ok
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('depth', type=int, nargs='?', default=3)
+    parser.add_argument('--check', action='store_true',
+                        help='verify against the golden node counts')
+    parser.add_argument('--max-depth', type=int, default=3,
+                        help='deepest golden depth checked by --check')
+    parser.add_argument('--divide', action='store_true',
+                        help='print node counts per root move')
+    parser.add_argument('--profile', action='store_true',
+                        help='print gipf.Board operation stats')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiler.Enable()
+
+    if args.check:
+        return 0 if Check(args.max_depth) else 1
+
+    if args.divide:
+        board = gipf.Board()
+        for move, nodes in Divide(board, board.WHITE, args.depth):
+            print '%d%d%d: %d' % (move[0], move[1], move[2], nodes)
+
+    nodes, elapsed = TimedPerft(args.depth)
+    print 'depth %d: %d nodes in %.3fs (%.0f nodes/sec)' % (
+        args.depth, nodes, elapsed, nodes / max(elapsed, 1e-9))
+    if args.profile:
+        print profiler.Format(profiler.Stats())
+    if args.depth in GOLDEN and nodes != GOLDEN[args.depth]:
+        print 'MISMATCH: expected', GOLDEN[args.depth]
+        return 1
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
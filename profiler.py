@@ -0,0 +1,193 @@
+"""
+Opt-in instrumentation of the gipf.Board hot paths.
+
+Enable() swaps instrumented wrappers in for the Board methods listed in
+OPERATIONS and Disable() puts the originals back, so an uninstrumented
+board pays nothing.  For every operation we count:
+
+    calls      number of calls
+    cells      board cells visited during the call: NextSpot steps, plus
+               the cells read through the gipf row tables by _RowCaptures
+               and _ResolveRowCapture
+    time       cumulative wall time, including nested operations
+    self_time  time not spent in other instrumented operations
+
+Each thread records into its own table and Stats() merges them, so this
+works inside server handler threads.  Pool workers call Enable() from the
+pool initializer (InitWorker) and ship Collect() back with their results,
+and the parent combines everything with Merge().
+"""
+
+import json
+import threading
+import timeit
+
+import gipf
+
+OPERATIONS = ('NextSpot',
+              '_InBoard',
+              'CanMove',
+              'LegalMoves',
+              'Move',
+              '_SlidePieces',
+              'Resolve',
+              'CaptureOptions',
+              '_RowCaptures',
+              '_ResolveRowCapture',
+              'CheckForWinner',
+              'Copy')
+
+FIELDS = ('calls', 'cells', 'time', 'self_time')
+
+_clock = timeit.default_timer
+
+_originals = {}
+_tables = []
+_tables_lock = threading.Lock()
+_local = threading.local()
+
+
+def _ThreadState():
+    """Return the recording state of the calling thread, creating it."""
+    try:
+        return _local.state
+    except AttributeError:
+        state = _local.state = _ThreadTable()
+        with _tables_lock:
+            _tables.append(state)
+        return state
+
+
+class _ThreadTable(object):
+    """Per thread counters and the stack of child times of active calls."""
+
+    def __init__(self):
+        self.cells = 0
+        self.stack = []
+        self.stats = dict((name, [0, 0, 0.0, 0.0]) for name in OPERATIONS)
+
+
+# Cells read by a call itself, from its arguments.  The row captures scan
+# the gipf row tables directly instead of stepping with NextSpot.
+_CELLS_READ = {'NextSpot': lambda args: 1,
+               '_RowCaptures': lambda args: gipf.CAPTURE_ROW_CELLS,
+               '_ResolveRowCapture': lambda args: args[1][2] - args[1][1]}
+
+
+def _Instrument(name, method):
+    cells_read = _CELLS_READ.get(name)
+
+    def Instrumented(*args, **kwargs):
+        state = _ThreadState()
+        own_cells = cells_read(args) if cells_read else 0
+        state.cells += own_cells
+        start_cells = state.cells
+        state.stack.append(0.0)
+        start = _clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = _clock() - start
+            child_time = state.stack.pop()
+            entry = state.stats[name]
+            entry[0] += 1
+            entry[1] += state.cells - start_cells + own_cells
+            entry[2] += elapsed
+            entry[3] += elapsed - child_time
+            if state.stack:
+                state.stack[-1] += elapsed
+
+    Instrumented.__name__ = name
+    Instrumented.__doc__ = method.__doc__
+    return Instrumented
+
+
+def Enabled():
+    return bool(_originals)
+
+
+def Enable():
+    """Swap the instrumented methods into gipf.Board."""
+    if _originals:
+        return
+    for name in OPERATIONS:
+        method = gipf.Board.__dict__[name]
+        _originals[name] = method
+        setattr(gipf.Board, name, _Instrument(name, method))
+
+
+def Disable():
+    """Restore the original gipf.Board methods."""
+    for name, method in _originals.items():
+        setattr(gipf.Board, name, method)
+    _originals.clear()
+
+
+def Reset():
+    """Zero the counters of every thread."""
+    with _tables_lock:
+        for table in _tables:
+            for entry in table.stats.values():
+                entry[:] = [0, 0, 0.0, 0.0]
+
+
+def Stats():
+    """Merged counters of all threads in this process.
+
+    Returns a dict mapping operation name to a dict of FIELDS, which is
+    plain data and can be pickled across processes or dumped as JSON.
+    """
+    with _tables_lock:
+        tables = [table.stats for table in _tables]
+    return Merge(*[_AsDicts(stats) for stats in tables])
+
+
+def Collect():
+    """Stats() followed by Reset(), for workers reporting incrementally."""
+    stats = Stats()
+    Reset()
+    return stats
+
+
+def Merge(*all_stats):
+    """Sum several Stats() results, e.g. from different processes."""
+    merged = dict((name, dict((field, 0) for field in FIELDS))
+                  for name in OPERATIONS)
+    for stats in all_stats:
+        for name, entry in stats.items():
+            target = merged.setdefault(
+                name, dict((field, 0) for field in FIELDS))
+            for field in FIELDS:
+                target[field] += entry.get(field, 0)
+    return merged
+
+
+def _AsDicts(stats):
+    return dict((name, dict(zip(FIELDS, entry)))
+                for name, entry in stats.items())
+
+
+def InitWorker():
+    """multiprocessing.Pool initializer that turns profiling on."""
+    Reset()
+    Enable()
+
+
+def Dump(stats, path):
+    """Write stats as JSON to path."""
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2, sort_keys=True)
+
+
+def Format(stats):
+    """Render stats as a text table, slowest operations first."""
+    lines = ['%-20s %12s %14s %10s %10s' %
+             ('operation', 'calls', 'cells', 'time', 'self')]
+    by_time = sorted(stats.items(), key=lambda item: -item[1]['time'])
+    for name, entry in by_time:
+        if not entry['calls']:
+            continue
+        lines.append('%-20s %12d %14d %10.3f %10.3f' %
+                     (name, entry['calls'], entry['cells'],
+                      entry['time'], entry['self_time']))
+    return '\n'.join(lines)
@@ -0,0 +1,119 @@
+"""
+Recorded GIPF games.
+
+A game record is one line of text:
+
+    <game_id> <winner> <move> <move> ...
+
+where winner is the winning color (0 if the game did not finish) and each
+move is three digits, letter, number and direction, e.g. 012.  White
+makes the first move and players alternate.  Blank lines and lines
+starting with # are ignored.
+"""
+
+import json
+import os
+
+import gipf
+
+
+class GameRecord(object):
+    """The moves of one game and its result."""
+
+    def __init__(self, game_id, moves=None, winner=0):
+        self.game_id = game_id
+        self.moves = list(moves or [])
+        self.winner = winner
+
+    def Format(self):
+        return ' '.join([str(self.game_id), str(self.winner)] +
+                        ['%d%d%d' % move for move in self.moves])
+
+
+def ParseGame(line):
+    """Parse one record line into a GameRecord."""
+    fields = line.split()
+    if len(fields) < 2:
+        raise ValueError('bad game record: %r' % line)
+    moves = []
+    for move in fields[2:]:
+        if len(move) != 3 or not move.isdigit():
+            raise ValueError('bad move %r in game %s' % (move, fields[0]))
+        moves.append((int(move[0]), int(move[1]), int(move[2])))
+    return GameRecord(fields[0], moves, int(fields[1]))
+
+
+def ReadGames(path):
+    """Stream the GameRecords stored in path."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            yield ParseGame(line)
+
+
+def AppendGame(path, record):
+    """Append a GameRecord to path."""
+    with open(path, 'a') as f:
+        f.write(record.Format() + '\n')
+
+
+def Positions(moves):
+    """Replay moves from the initial board.
+
+    Yields (ply, board, color, move) before each move is played, where
+    board is the position color moves in.  The board object is reused
+    and updated in place, so copy it to keep it.  Replay stops after
+    yielding a move the board does not allow.
+    """
+    board = gipf.Board()
+    color = board.WHITE
+    for ply, move in enumerate(moves):
+        yield ply, board, color, move
+        if not board.Move(move[0], move[1], move[2], color):
+            return
+        board.Resolve(color)
+        color = board.NextColor(color)
+
+
+def ReadJsonLines(path):
+    """Stream the objects of a JSON lines file, if it exists.
+
+    A truncated last line, as left by an interrupted run, is skipped.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def TrimPartialLine(path):
+    """Drop a truncated last line from path so appends start cleanly."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 4096)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            if pos == end and chunk.endswith('\n'):
+                return
+            newline = chunk.rfind('\n')
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+def CompletedKeys(path, key):
+    """The set of obj[key] over a JSON lines results file, for resuming."""
+    return set(obj[key] for obj in ReadJsonLines(path) if key in obj)
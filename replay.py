@@ -0,0 +1,63 @@
+"""
+Random access to the positions of a recorded game.
+
+Replaying a game from the initial board to reach ply n costs n moves, so a
+Replay keeps a Board.Pack snapshot every checkpoint_interval plies and
+reaches any ply from the nearest checkpoint at or before it.  Stepping
+forward from the last position returned only plays the moves in between.
+"""
+
+import gipf
+
+
+class Replay(object):
+    """Positions of a game given as a list of (letter, number, direction).
+
+    Ply 0 is the initial board and ply n the board after n moves.  Replay
+    stops at the first move the board does not allow, so len() counts the
+    positions of the legal prefix of the game.
+    """
+
+    def __init__(self, moves, checkpoint_interval=16):
+        self._interval = checkpoint_interval
+        self._checkpoints = []
+        self.moves = []
+        board = gipf.Board()
+        color = board.WHITE
+        for move in moves:
+            if len(self.moves) % self._interval == 0:
+                self._checkpoints.append(board.Pack())
+            if not board.Move(move[0], move[1], move[2], color):
+                break
+            board.Resolve(color)
+            self.moves.append(tuple(move))
+            color = board.NextColor(color)
+        if len(self.moves) % self._interval == 0:
+            self._checkpoints.append(board.Pack())
+        self._ply = len(self.moves)
+        self._board = board
+
+    def __len__(self):
+        return len(self.moves) + 1
+
+    def ColorToMove(self, ply):
+        """Color whose move follows position ply."""
+        if ply % 2 == 0:
+            return gipf.Board.WHITE
+        return gipf.Board.BLACK
+
+    def Board(self, ply):
+        """A copy of the board after ply moves."""
+        if ply < 0 or ply >= len(self):
+            raise IndexError('ply %d out of range' % ply)
+        checkpoint = ply // self._interval
+        if not (checkpoint * self._interval <= self._ply <= ply):
+            self._board.Unpack(self._checkpoints[checkpoint])
+            self._ply = checkpoint * self._interval
+        while self._ply < ply:
+            letter, number, direction = self.moves[self._ply]
+            color = self.ColorToMove(self._ply)
+            self._board.Move(letter, number, direction, color)
+            self._board.Resolve(color)
+            self._ply += 1
+        return self._board.Copy()
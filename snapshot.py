@@ -0,0 +1,178 @@
+"""
+Binary snapshots of the live games of a server, for hot restarts.
+
+A snapshot file is a header followed by one record per game:
+
+    header   'GIPFSNAP', version (B), number of games (I)
+    game     id length (B), id, color to move (B), moves played (H),
+             white and black clock seconds (dd, NaN without a clock),
+             Board.Pack() snapshot (BOARD_SIZE bytes), players (B),
+             players x (name length (B), name, color (B)),
+             moves (3 bytes each: letter, number, direction)
+
+Games are restored from their board snapshots, so restore time depends on
+the number of games and not on how long they have been going.  The move
+list only comes along so that finished games can still be recorded.
+"""
+
+import os
+import struct
+import threading
+
+import gipf
+
+MAGIC = 'GIPFSNAP'
+VERSION = 2
+BOARD_SIZE = len(gipf.Board().Pack())
+
+_HEADER = struct.Struct('<8sBI')
+_GAME = struct.Struct('<BHdd%ds' % BOARD_SIZE)
+_NAME_LENGTH = struct.Struct('<B')
+_PLAYERS = struct.Struct('<B')
+_COLOR = struct.Struct('<B')
+
+
+class GameSnapshot(object):
+    """The state of one live game, as plain data."""
+
+    __slots__ = ('game_id', 'to_move', 'clocks', 'board', 'players',
+                 'moves')
+
+    def __init__(self, game_id, to_move, clocks, board, players, moves):
+        self.game_id = game_id
+        self.to_move = to_move
+        # (white, black) seconds left, or None without a time control.
+        self.clocks = clocks
+        # Board.Pack() snapshot.
+        self.board = board
+        # List of (player_name, color).
+        self.players = players
+        # Moves as a string of 3 bytes each.
+        self.moves = moves
+
+
+def _PackString(value):
+    if len(value) > 255:
+        raise ValueError('%r is too long for a snapshot' % value)
+    return _NAME_LENGTH.pack(len(value)) + value
+
+
+def _UnpackString(data, offset):
+    (length,) = _NAME_LENGTH.unpack_from(data, offset)
+    start = offset + _NAME_LENGTH.size
+    return data[start:start + length], start + length
+
+
+def PackMoves(moves):
+    """Encode a list of (letter, number, direction) as 3 bytes each."""
+    data = bytearray(3 * len(moves))
+    k = 0
+    for letter, number, direction in moves:
+        data[k] = letter
+        data[k + 1] = number
+        data[k + 2] = direction
+        k += 3
+    return str(data)
+
+
+def UnpackMoves(data):
+    """Decode PackMoves output back into a list of tuples."""
+    values = iter(bytearray(data))
+    return zip(values, values, values)
+
+
+def Write(path, games):
+    """Atomically replace path with a snapshot of games."""
+    chunks = [_HEADER.pack(MAGIC, VERSION, len(games))]
+    for game in games:
+        if game.clocks is None:
+            white_clock = black_clock = float('nan')
+        else:
+            white_clock, black_clock = game.clocks
+        chunks.append(_PackString(game.game_id))
+        chunks.append(_GAME.pack(game.to_move, len(game.moves) // 3,
+                                 white_clock, black_clock, game.board))
+        chunks.append(_PLAYERS.pack(len(game.players)))
+        for name, color in game.players:
+            chunks.append(_PackString(name))
+            chunks.append(_COLOR.pack(color))
+        chunks.append(game.moves)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(''.join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temp_path, path)
+
+
+def Read(path):
+    """Read the GameSnapshots stored in path."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version not in (1, VERSION):
+        raise ValueError('%s is not a version %d snapshot' % (path, VERSION))
+    offset = _HEADER.size
+    games = []
+    for _ in range(count):
+        game_id, offset = _UnpackString(data, offset)
+        (to_move, num_moves, white_clock, black_clock,
+         board) = _GAME.unpack_from(data, offset)
+        offset += _GAME.size
+        # Version 1 always stored two players.
+        num_players = 2
+        if version > 1:
+            (num_players,) = _PLAYERS.unpack_from(data, offset)
+            offset += _PLAYERS.size
+        players = []
+        for _ in range(num_players):
+            name, offset = _UnpackString(data, offset)
+            (color,) = _COLOR.unpack_from(data, offset)
+            offset += _COLOR.size
+            players.append((name, color))
+        moves = data[offset:offset + 3 * num_moves]
+        offset += 3 * num_moves
+        clocks = None
+        if white_clock == white_clock:
+            clocks = (white_clock, black_clock)
+        games.append(GameSnapshot(game_id, to_move, clocks, board, players,
+                                  moves))
+    return games
+
+
+class SnapshotWriter(threading.Thread):
+    """Writes a snapshot every interval seconds, or when Request()ed.
+
+    collect() must return the GameSnapshots to write.  It is called from
+    this thread, so taking each game's snapshot only holds up that game
+    for as long as it takes to copy its state.
+    """
+
+    def __init__(self, path, interval, collect):
+        super(SnapshotWriter, self).__init__()
+        self.daemon = True
+        self._path = path
+        self._interval = interval
+        self._collect = collect
+        self._requested = threading.Event()
+        self._write_lock = threading.Lock()
+
+    def Request(self):
+        """Write a snapshot as soon as possible."""
+        self._requested.set()
+
+    def WriteNow(self):
+        """Write a snapshot from the calling thread."""
+        with self._write_lock:
+            games = self._collect()
+            Write(self._path, games)
+        return len(games)
+
+    def run(self):
+        while True:
+            self._requested.wait(self._interval)
+            self._requested.clear()
+            try:
+                self.WriteNow()
+            except (IOError, OSError, ValueError, struct.error), e:
+                print 'ERROR - snapshot failed:', e
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+Headless bot tournaments with Elo ratings.
+
+Players are given as specs:
+
+    random                  uniformly random legal moves
+    static                  best move by static evaluation
+    negamax:DEPTH[:NODES]   engine.Engine with a depth and node budget
+
+Games are scheduled round robin (every pair) or as a gauntlet (the first
+player against each of the others), each pairing playing --games games
+with colors swapped every game.  Games run in worker processes with the
+same Move, Resolve and CheckForWinner rules the server enforces, and each
+result is appended to the output as a JSON line as soon as it finishes.
+Rerunning with the same output file skips finished games:
+
+    tournament.py results.jsonl random static negamax:2 --games 20
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+import zlib
+
+import engine
+import gipf
+import records
+
+
+class RandomPlayer(object):
+    """Plays a uniformly random legal move."""
+
+    def __init__(self, rng):
+        self._rng = rng
+
+    def ChooseMove(self, board, color):
+        return self._rng.choice(board.LegalMoves())
+
+
+class EnginePlayer(object):
+    """Plays the best move of an engine.Engine."""
+
+    def __init__(self, game_engine, rng):
+        self._engine = game_engine
+        self._rng = rng
+
+    def ChooseMove(self, board, color):
+        scores = self._engine.ScoreMoves(board, color)
+        best = max(scores.values())
+        # Break ties randomly so repeated games differ.
+        return self._rng.choice(sorted(move for move in scores
+                                       if scores[move] == best))
+
+
+def MakePlayer(spec, rng):
+    """Build a player from a spec such as 'negamax:2:5000'."""
+    fields = spec.split(':')
+    if fields[0] == 'random' and len(fields) == 1:
+        return RandomPlayer(rng)
+    if fields[0] == 'static' and len(fields) == 1:
+        return EnginePlayer(engine.MakeEngine('static'), rng)
+    if fields[0] == 'negamax' and 2 <= len(fields) <= 3:
+        max_nodes = int(fields[2]) if len(fields) == 3 else None
+        return EnginePlayer(engine.MakeEngine('negamax', int(fields[1]),
+                                              max_nodes), rng)
+    raise ValueError('bad player spec %r' % spec)
+
+
+def PlayGame(white_spec, black_spec, seed, max_plies):
+    """Play one game, returning (winner, moves).
+
+    winner is 0 for a game stopped at max_plies.  A player with no legal
+    move loses.
+    """
+    rng = random.Random(seed)
+    players = {gipf.Board.WHITE: MakePlayer(white_spec, rng),
+               gipf.Board.BLACK: MakePlayer(black_spec, rng)}
+    board = gipf.Board()
+    color = board.WHITE
+    moves = []
+    while len(moves) < max_plies:
+        if not board.LegalMoves():
+            return board.NextColor(color), moves
+        move = players[color].ChooseMove(board, color)
+        board.Move(move[0], move[1], move[2], color)
+        # The server resolves crossing rows with the first option, and
+        # records only the moves, so games must not choose otherwise.
+        board.Resolve(color)
+        moves.append(move)
+        winner = board.CheckForWinner()
+        if winner:
+            return winner, moves
+        color = board.NextColor(color)
+    return 0, moves
+
+
+def Schedule(players, games, mode):
+    """List the (game_id, white, black) games of a tournament."""
+    if mode == 'gauntlet':
+        pairs = [(players[0], other) for other in players[1:]]
+    else:
+        pairs = list(itertools.combinations(players, 2))
+    schedule = []
+    for first, second in pairs:
+        for k in range(games):
+            if k % 2 == 0:
+                white, black = first, second
+            else:
+                white, black = second, first
+            game_id = '%s vs %s #%d' % (first, second, k)
+            schedule.append((game_id, white, black))
+    return schedule
+
+
+def _PlayTask(task):
+    game_id, white, black, seed, max_plies = task
+    start = time.time()
+    winner, moves = PlayGame(white, black, seed, max_plies)
+    return {'game_id': game_id,
+            'white': white,
+            'black': black,
+            'winner': winner,
+            'plies': len(moves),
+            'moves': ' '.join('%d%d%d' % move for move in moves),
+            'seconds': round(time.time() - start, 3)}
+
+
+def Run(output_path, players, games=10, mode='roundrobin', processes=None,
+        max_plies=300, seed=0):
+    """Play every scheduled game not yet in output_path."""
+    records.TrimPartialLine(output_path)
+    done = records.CompletedKeys(output_path, 'game_id')
+    tasks = [(game_id, white, black,
+              zlib.crc32(game_id) ^ seed, max_plies)
+             for game_id, white, black in Schedule(players, games, mode)
+             if game_id not in done]
+    if done:
+        print 'Resuming, %d games already played' % len(done)
+    pool = multiprocessing.Pool(processes)
+    count = 0
+    start = time.time()
+    try:
+        with open(output_path, 'a') as out:
+            for result in pool.imap_unordered(_PlayTask, tasks):
+                out.write(json.dumps(result, sort_keys=True) + '\n')
+                out.flush()
+                count += 1
+                print '[%d/%d] %s: winner %d after %d plies' % (
+                    count, len(tasks), result['game_id'], result['winner'],
+                    result['plies'])
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    print 'Played %d games in %.1fs' % (count, time.time() - start)
+
+
+def Ratings(results, iterations=1000):
+    """Elo ratings with 95% confidence intervals from game results.
+
+    Fits a Bradley-Terry model by minorization-maximization, with draws
+    and unfinished games scored as half a win for each side, and one
+    virtual draw per pairing so that unbeaten players stay finite.
+    Intervals come from the diagonal of the Fisher information.
+
+    Returns a list of (player, games, score, elo, interval) sorted by elo,
+    where elo is relative to the mean of all players.
+    """
+    wins = {}
+    games = {}
+    players = set()
+    for result in results:
+        white, black = result['white'], result['black']
+        players.update((white, black))
+        pair = tuple(sorted((white, black)))
+        if pair not in games:
+            games[pair] = 1.0
+            for player in pair:
+                wins[(player, pair)] = 0.5
+        games[pair] += 1
+        if result['winner'] == gipf.Board.WHITE:
+            wins[(white, pair)] += 1
+        elif result['winner'] == gipf.Board.BLACK:
+            wins[(black, pair)] += 1
+        else:
+            wins[(white, pair)] += 0.5
+            wins[(black, pair)] += 0.5
+
+    players = sorted(players)
+    if not players:
+        return []
+    strength = dict((player, 1.0) for player in players)
+    for _ in range(iterations):
+        for player in players:
+            total_wins = 0.0
+            denominator = 0.0
+            for pair, n in games.items():
+                if player not in pair:
+                    continue
+                other = pair[1] if pair[0] == player else pair[0]
+                total_wins += wins[(player, pair)]
+                denominator += n / (strength[player] + strength[other])
+            strength[player] = total_wins / denominator
+        norm = math.exp(sum(math.log(s) for s in strength.values()) /
+                        len(players))
+        for player in players:
+            strength[player] /= norm
+
+    scale = 400.0 / math.log(10.0)
+    table = []
+    for player in players:
+        information = 0.0
+        score = 0.0
+        played = 0
+        for pair, n in games.items():
+            if player not in pair:
+                continue
+            other = pair[1] if pair[0] == player else pair[0]
+            p = strength[player] / (strength[player] + strength[other])
+            information += n * p * (1 - p)
+            # Leave out the virtual draw when reporting.
+            score += wins[(player, pair)] - 0.5
+            played += int(n) - 1
+        elo = scale * math.log(strength[player])
+        interval = 1.96 * scale / math.sqrt(information)
+        table.append((player, played, score / max(played, 1), elo,
+                      interval))
+    table.sort(key=lambda row: -row[3])
+    return table
+
+
+def FormatRatings(table):
+    lines = ['%-24s %6s %7s %12s' % ('player', 'games', 'score', 'elo')]
+    for player, played, score, elo, interval in table:
+        lines.append('%-24s %6d %6.1f%% %6.0f +/- %.0f' %
+                     (player, played, 100 * score, elo, interval))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('output', help='JSON lines file of game results')
+    parser.add_argument('players', nargs='*', help='player specs')
+    parser.add_argument('--games', type=int, default=10,
+                        help='games per pairing, alternating colors')
+    parser.add_argument('--mode', choices=('roundrobin', 'gauntlet'),
+                        default='roundrobin')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--max-plies', type=int, default=300,
+                        help='plies after which a game is a draw')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.players:
+        for spec in args.players:
+            MakePlayer(spec, random.Random())
+        if len(args.players) < 2:
+            parser.error('need at least two players')
+        Run(args.output, args.players, args.games, args.mode,
+            args.processes, args.max_plies, args.seed)
+    print FormatRatings(Ratings(records.ReadJsonLines(args.output)))
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
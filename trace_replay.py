@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+Deterministic replay of a client trace against an in-process server.
+
+Record a workload with a seeded, tracing server, for example:
+
+    gipf_server.py --seed 1 --trace bots.trace
+    multiplex.py --games 200
+
+then replay it.  Every connection of the trace becomes a socketpair into
+a GIPFServer running in this process, with the trace's seed and no clock.
+Messages are sent one at a time in trace order, each once the server has
+handled the one before, and connections are closed where the trace says
+they closed, so every run makes the same games and the server sends the
+same bytes on every connection:
+
+    trace_replay.py bots.trace --write-golden bots.golden
+    trace_replay.py bots.trace --check bots.golden --timings new.jsonl \\
+        --baseline old.jsonl
+
+Each message is timed from its send until the server has handled it and
+sent its replies.  --timings saves the times and --baseline prints them
+next to an earlier run's.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import gipf_server
+import messages
+import records
+import traces
+
+class _Connection(object):
+    """The client end of one socketpair, collecting what the server sends.
+
+    handled counts the messages the server has handled, and condition is
+    notified when it changes or when the server side ends.
+    """
+
+    def __init__(self, server, condition):
+        self.socket, server_socket = socket.socketpair()
+        self.handled = 0
+        self.output = []
+        self._condition = condition
+        self.handler = server.AddConnection(server_socket, self._Handled)
+        self._reader = threading.Thread(target=self._Read)
+        self._reader.daemon = True
+        self._reader.start()
+        self._watcher = threading.Thread(target=self._Watch)
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def _Handled(self, count):
+        with self._condition:
+            self.handled += count
+            self._condition.notify_all()
+
+    def _Watch(self):
+        # Wake the replay if the handler stops without handling a message.
+        self.handler.join()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _Read(self):
+        while True:
+            data = self.socket.recv(65536)
+            if not data:
+                break
+            self.output.append(data)
+
+    def Close(self):
+        """Stop the server side and return everything it sent."""
+        self.handler.Stop()
+        # Leaving may forfeit games, which sends to other connections, so
+        # wait for it before the next connection is closed.
+        self.handler.join()
+        self._watcher.join()
+        self._reader.join()
+        self.socket.close()
+        return ''.join(self.output)
+
+
+def _Command(data):
+    """Name of the message in data, looking inside Session envelopes."""
+    msg = messages.Unpack(data)
+    if isinstance(msg, messages.Session):
+        msg = msg.msg
+    return msg.CMD
+
+
+def Replay(seed, events):
+    """Replay trace events against a fresh in-process server.
+
+    Returns ({connection_id: bytes sent by the server}, timings), where
+    timings lists (command, seconds) for each event.
+    """
+    server = gipf_server.GIPFServer(seed=seed)
+    condition = threading.Condition()
+    connections = {}
+    timings = []
+    outputs = {}
+    for connection_id, data in events:
+        connection = connections.get(connection_id)
+        if data is None:
+            # The connection closed, which leaves its games.
+            if connection is not None:
+                outputs[connection_id] = connection.Close()
+                del connections[connection_id]
+            continue
+        if connection is None:
+            connection = _Connection(server, condition)
+            connections[connection_id] = connection
+        with condition:
+            target = connection.handled + 1
+        start = time.time()
+        connection.socket.sendall(data)
+        with condition:
+            # No timeout: Python 2 polls timed waits, which would swamp
+            # the times being measured.
+            while (connection.handled < target and
+                   connection.handler.is_alive()):
+                condition.wait()
+        timings.append((_Command(data), time.time() - start))
+    for connection_id, connection in connections.items():
+        outputs[connection_id] = connection.Close()
+    return outputs, timings
+
+
+def Compare(expected, actual):
+    """Describe how the server's output differs from expected, if at all."""
+    problems = []
+    for connection_id in sorted(set(expected) | set(actual)):
+        want = expected.get(connection_id, '')
+        got = actual.get(connection_id, '')
+        if want == got:
+            continue
+        want_msgs = messages.UnpackAll(want)[0]
+        got_msgs = messages.UnpackAll(got)[0]
+        k = 0
+        while (k < min(len(want_msgs), len(got_msgs)) and
+               want_msgs[k].Pack() == got_msgs[k].Pack()):
+            k += 1
+        problems.append('connection %d: message %d differs, expected %s '
+                        'got %s' % (connection_id, k,
+                                    _Describe(want_msgs[k:k + 1]),
+                                    _Describe(got_msgs[k:k + 1])))
+    return problems
+
+
+def _Describe(msgs):
+    if not msgs:
+        return 'nothing'
+    return repr(msgs[0].Pack())
+
+
+def _Percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def Summarize(timings):
+    """{command: (count, mean, p50, p99, max)} of timings in seconds."""
+    by_command = {}
+    for command, seconds in timings:
+        by_command.setdefault(command, []).append(seconds)
+    by_command['all'] = [seconds for _, seconds in timings]
+    summary = {}
+    for command, values in by_command.items():
+        if not values:
+            continue
+        values.sort()
+        summary[command] = (len(values), sum(values) / len(values),
+                            _Percentile(values, 0.5),
+                            _Percentile(values, 0.99), values[-1])
+    return summary
+
+
+def FormatSummary(summary, baseline=None):
+    header = '%-4s %7s %9s %9s %9s %9s' % ('msg', 'count', 'mean ms',
+                                           'p50 ms', 'p99 ms', 'max ms')
+    if baseline:
+        header += '   p50 vs baseline'
+    lines = [header]
+    for command in sorted(summary):
+        count, mean, p50, p99, worst = summary[command]
+        line = '%-4s %7d %9.3f %9.3f %9.3f %9.3f' % (
+            command, count, 1e3 * mean, 1e3 * p50, 1e3 * p99, 1e3 * worst)
+        if baseline and command in baseline:
+            line += '   %.3f -> %.3f (%+.0f%%)' % (
+                1e3 * baseline[command][2], 1e3 * p50,
+                100 * (p50 / baseline[command][2] - 1))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _ReadGolden(path):
+    with open(path) as f:
+        golden = json.load(f)
+    return dict((int(connection_id), data.decode('hex'))
+                for connection_id, data in golden['outputs'].items())
+
+
+def _WriteGolden(path, seed, outputs):
+    golden = {'seed': seed,
+              'outputs': dict((str(connection_id), data.encode('hex'))
+                              for connection_id, data in outputs.items())}
+    with open(path, 'w') as f:
+        json.dump(golden, f, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('trace', help='trace written by gipf_server --trace')
+    parser.add_argument('--write-golden', metavar='FILE',
+                        help='save what the server sent to FILE')
+    parser.add_argument('--check', metavar='FILE',
+                        help='fail unless the server sends exactly what '
+                        'FILE has')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='save per-message times as JSON lines')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare with times saved by an earlier run')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the server log')
+    args = parser.parse_args(argv)
+
+    seed, events = traces.Read(args.trace)
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    start = time.time()
+    try:
+        outputs, timings = Replay(seed, events)
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    print 'Replayed %d messages on %d connections in %.2fs' % (
+        sum(1 for _, data in events if data is not None), len(outputs),
+        elapsed)
+
+    if args.timings:
+        with open(args.timings, 'w') as f:
+            for k, (command, seconds) in enumerate(timings):
+                f.write(json.dumps({'event': k, 'msg': command,
+                                    'seconds': seconds}) + '\n')
+    baseline = None
+    if args.baseline:
+        baseline = Summarize([(obj['msg'], obj['seconds']) for obj in
+                              records.ReadJsonLines(args.baseline)])
+    print FormatSummary(Summarize(timings), baseline)
+
+    if args.write_golden:
+        _WriteGolden(args.write_golden, seed, outputs)
+        print 'Wrote', args.write_golden
+    if args.check:
+        problems = Compare(_ReadGolden(args.check), outputs)
+        for problem in problems:
+            print 'MISMATCH -', problem
+        if problems:
+            return 1
+        print 'Output matches', args.check
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,72 @@
+"""
+Traces of the messages clients send to a server, for replaying later.
+
+A trace file starts with the seed the server assigned colors with and
+then has one line per message, in the order the server handled them:
+
+    # seed 1234
+    <connection> <message as hex>
+    <connection> close
+
+where connection numbers the server's connections in the order they were
+accepted, and a close line marks where a connection ended and the server
+left its games.  Replaying a trace against a server with the same seed, one
+message at a time, reproduces the games exactly; see trace_replay.py.
+"""
+
+import threading
+
+
+class TraceWriter(object):
+    """Appends the messages handled by a server to a trace file.
+
+    Handlers hold lock while they log and handle a message, so the order
+    of the trace is the order the server acted in even with many
+    connections.  That serializes the server, so tracing is meant for
+    capturing workloads, not for normal operation.
+    """
+
+    def __init__(self, path, seed):
+        self.lock = threading.Lock()
+        self._file = open(path, 'w')
+        self._file.write('# seed %d\n' % seed)
+
+    def Log(self, connection_id, msg):
+        """Record msg from connection_id.  Call with lock held."""
+        self._file.write('%d %s\n' % (connection_id,
+                                      msg.Pack().encode('hex')))
+
+    def LogClose(self, connection_id):
+        """Record that connection_id ended.  Call with lock held."""
+        self._file.write('%d close\n' % connection_id)
+
+    def Close(self):
+        with self.lock:
+            self._file.close()
+
+
+def Read(path):
+    """Read a trace file into (seed, [(connection_id, data), ...]).
+
+    data is None where the connection closed.
+    """
+    seed = None
+    events = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == '#':
+                if len(fields) == 3 and fields[1] == 'seed':
+                    seed = int(fields[2])
+                continue
+            if len(fields) != 2:
+                raise ValueError('bad trace line: %r' % line)
+            if fields[1] == 'close':
+                events.append((int(fields[0]), None))
+            else:
+                events.append((int(fields[0]), fields[1].decode('hex')))
+    if seed is None:
+        raise ValueError('%s has no seed' % path)
+    return seed, events